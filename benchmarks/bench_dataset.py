@@ -0,0 +1,43 @@
+import argparse
+import time
+
+from common import use_package, latency_result, throughput_result, write_results
+from synthetic import make_dataset
+
+use_package('training')
+from meld_dataset import MELDDataset  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=str, required=True)
+    parser.add_argument("--num-clips", type=int, default=16)
+    parser.add_argument("--clip-duration", type=float, default=3.0)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+
+    csv_path, video_dir = make_dataset(
+        args.data_dir, args.num_clips, args.clip_duration)
+    dataset = MELDDataset(csv_path, video_dir)
+
+    # First pass warms the page cache and the tokenizer
+    dataset[0]
+
+    times = []
+    start = time.perf_counter()
+    for idx in range(len(dataset)):
+        sample_start = time.perf_counter()
+        if dataset[idx] is None:
+            raise RuntimeError(f"Sample {idx} failed to load")
+        times.append((time.perf_counter() - sample_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    write_results(args.output, {
+        'dataset/getitem_latency': latency_result(times),
+        'dataset/getitem_throughput': throughput_result(
+            len(dataset) / elapsed, 'samples/s')
+    })
+
+
+if __name__ == "__main__":
+    main()
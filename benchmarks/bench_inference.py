@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+import cv2
+import numpy as np
+import torch
+
+from common import use_package, measure, latency_result, write_results
+from synthetic import make_clip
+
+use_package('deployment')
+from transformers import AutoTokenizer  # noqa: E402
+from modeling import (build_model, MODEL_CONFIG_NAME,  # noqa: E402
+                      load_model_weights, MODEL_WEIGHTS_NAME)
+from inference import predict_fn  # noqa: E402
+from transcribers import build_transcriber, TRANSCRIBERS  # noqa: E402
+
+
+class FixedSegmentTranscriber:
+    # Synthetic clips have no speech, so by default the video is cut into
+    # fixed-length segments and Whisper is left out of the measurement
+    def __init__(self, segment_length):
+        self.segment_length = segment_length
+
+    def transcribe(self, video_path):
+        cap = cv2.VideoCapture(video_path)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.segment_length, duration)
+            segments.append({'start': start, 'end': end,
+                             'text': 'This is a synthetic utterance.'})
+            start = end
+        return segments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=str, required=True)
+    parser.add_argument("--video-lengths", type=float, nargs="+", default=[5, 15])
+    parser.add_argument("--segment-length", type=float, default=2.5)
+    parser.add_argument("--whisper-model", type=str, default=None,
+                        help="Transcribe with Whisper instead of fixed segments")
+    parser.add_argument("--transcriber-backend", type=str, default="whisper",
+                        choices=list(TRANSCRIBERS))
+    parser.add_argument("--no-word-timestamps", action="store_true")
+    parser.add_argument("--vad", action="store_true")
+    parser.add_argument("--architecture", type=str, default="multimodal")
+    parser.add_argument("--model-dir", type=str, default=None,
+                        help="Trained model.safetensors, or model.pth and "
+                        "model_config.json if present")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model_config = {'architecture': args.architecture}
+    config_path = os.path.join(args.model_dir or '', MODEL_CONFIG_NAME)
+    if args.model_dir and os.path.exists(config_path):
+        with open(config_path) as f:
+            model_config = json.load(f)
+
+    weights_path = os.path.join(args.model_dir or '', MODEL_WEIGHTS_NAME)
+    if args.model_dir and os.path.exists(weights_path):
+        model, _ = load_model_weights(weights_path, device)
+    else:
+        # model.pth replaces every weight, and random ones time the same as
+        # pretrained ones, so nothing is downloaded
+        model = build_model(model_config, pretrained=False).to(device)
+        if args.model_dir:
+            model.load_state_dict(torch.load(
+                os.path.join(args.model_dir, 'model.pth'),
+                map_location=device, weights_only=True))
+        model.eval()
+
+    # Transcriber settings are part of the result name, so runs with
+    # different settings are never compared against each other
+    name = 'predict_fn'
+    if args.whisper_model:
+        name += f'-{args.transcriber_backend}-{args.whisper_model}'
+        if args.no_word_timestamps:
+            name += '-nowords'
+        if args.vad:
+            name += '-vad'
+        transcriber = build_transcriber(
+            device, backend=args.transcriber_backend,
+            model_name=args.whisper_model,
+            word_timestamps=not args.no_word_timestamps, vad=args.vad)
+    else:
+        transcriber = FixedSegmentTranscriber(args.segment_length)
+
+    model_dict = {
+        'model': model,
+        'tokenizer': AutoTokenizer.from_pretrained('bert-base-uncased'),
+        'transcriber': transcriber,
+        'device': device
+    }
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for length in args.video_lengths:
+        video_path = make_clip(
+            os.path.join(args.data_dir, f'video_{length:g}s.mp4'), length)
+
+        stages = defaultdict(list)
+
+        def run():
+            response = predict_fn({'video_path': video_path,
+                                   'return_timings': True}, model_dict)
+            for name, value in response['timings'].items():
+                stages[name].append(value)
+
+        # The first call sets up the model, tokenizer and ffmpeg. Like its
+        # total, its stage timings are left out of the medians
+        run()
+        stages.clear()
+        times = measure(run, warmup=0, repeats=args.repeats, device=device)
+        result = latency_result(times)
+        result['stages_ms'] = {name: float(np.median(values))
+                               for name, values in stages.items()}
+        results[f"inference/{model_config['architecture']}/{name}/{length:g}s"] = result
+
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import torch
+
+from common import use_package, available_devices, measure, latency_result, write_results
+
+use_package('training')
+from modeling import build_model  # noqa: E402
+
+
+def make_inputs(model, batch_size, device):
+    if hasattr(model.text_encoder, 'bert'):
+        vocab_size = model.text_encoder.bert.config.vocab_size
+    else:
+        vocab_size = model.text_encoder.token_embedding.num_embeddings
+    return {
+        'text_inputs': {
+            'input_ids': torch.randint(0, vocab_size, (batch_size, 128), device=device),
+            'attention_mask': torch.ones(batch_size, 128, dtype=torch.long, device=device)
+        },
+        'video_frames': torch.rand(batch_size, 30, 3, 224, 224, device=device),
+        'audio_features': torch.randn(batch_size, 1, 64, 300, device=device)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--architecture", type=str, default="multimodal")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--devices", type=str, nargs="+", default=None)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+
+    results = {}
+    for device in args.devices or available_devices():
+        # Random weights time the same as pretrained ones, without a download
+        model = build_model({'architecture': args.architecture},
+                            pretrained=False).to(device).eval()
+
+        for batch_size in args.batch_sizes:
+            inputs = make_inputs(model, batch_size, device)
+            text, video, audio = (inputs['text_inputs'], inputs['video_frames'],
+                                  inputs['audio_features'])
+            components = {
+                'text_encoder': lambda: model.text_encoder(
+                    text['input_ids'], text['attention_mask']),
+                'video_encoder': lambda: model.video_encoder(video),
+                'audio_encoder': lambda: model.audio_encoder(audio),
+                'full': lambda: model(text, video, audio)
+            }
+
+            with torch.inference_mode():
+                for name, fn in components.items():
+                    times = measure(fn, repeats=args.repeats, device=device)
+                    results[f'model/{args.architecture}/{name}/{device}/bs{batch_size}'] = latency_result(times)
+
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+import torch
+
+from common import use_package, latency_result, throughput_result, write_results
+from synthetic import make_clip
+
+use_package('deployment')
+from modeling import build_model  # noqa: E402
+from preprocessing import (PreprocessingConfig, load_video_frames,  # noqa: E402
+                           extract_audio_features, thread_budget, apply_thread_budget)
+
+
+def serve_requests(clip_path, architecture, budgeted, workers, repeats,
+                   start_barrier, results):
+    # One model-server worker: preprocess a clip and run the model on it,
+    # on the CPU, repeats times
+    if budgeted:
+        apply_thread_budget(thread_budget(workers=workers))
+
+    config = PreprocessingConfig()
+    model = build_model({'architecture': architecture}, pretrained=False).eval()
+    text_inputs = {
+        'input_ids': torch.randint(0, 1000, (1, config.max_length)),
+        'attention_mask': torch.ones(1, config.max_length, dtype=torch.long)
+    }
+
+    def request():
+        video_frames = load_video_frames(clip_path, config).unsqueeze(0)
+        audio_features = extract_audio_features(clip_path, config).unsqueeze(0)
+        with torch.inference_mode():
+            model(text_inputs, video_frames, audio_features)
+
+    request()
+    start_barrier.wait()
+    started = time.time()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        request()
+        times.append((time.perf_counter() - start) * 1000)
+    results.put((times, started, time.time()))
+
+
+def run_workers(clip_path, architecture, budgeted, workers, repeats, data_dir):
+    # All workers start their timed requests together, as under load
+    context = multiprocessing.get_context('spawn')
+    start_barrier = context.Barrier(workers)
+    results = context.Queue()
+
+    processes = []
+    for i in range(workers):
+        # Audio extraction writes next to the clip, so each worker has its own
+        worker_clip = os.path.join(data_dir, f'worker_{i}.mp4')
+        shutil.copy(clip_path, worker_clip)
+        processes.append(context.Process(target=serve_requests, args=(
+            worker_clip, architecture, budgeted, workers, repeats,
+            start_barrier, results)))
+
+    for process in processes:
+        process.start()
+    # A worker that dies, e.g. out of memory, would leave the rest waiting
+    reports = []
+    while len(reports) < workers:
+        try:
+            reports.append(results.get(timeout=10))
+        except queue.Empty:
+            failed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+            if failed:
+                for process in processes:
+                    process.kill()
+                raise RuntimeError(f"A worker exited with status {failed[0]}")
+    for process in processes:
+        process.join()
+
+    # Wall time from the common start to the last worker finishing
+    times = [t for report in reports for t in report[0]]
+    elapsed = max(r[2] for r in reports) - min(r[1] for r in reports)
+    return times, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", type=str, required=True)
+    parser.add_argument("--architecture", type=str, default="student")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clip-duration", type=float, default=3.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    clip_path = make_clip(os.path.join(args.data_dir, 'clip.mp4'), args.clip_duration)
+
+    results = {}
+    for workers in args.workers:
+        for budgeted in [False, True]:
+            mode = 'budget' if budgeted else 'default'
+            times, elapsed = run_workers(clip_path, args.architecture, budgeted,
+                                         workers, args.repeats, args.data_dir)
+            name = f'threads/{args.architecture}/w{workers}/{mode}'
+            results[f'{name}/latency'] = latency_result(times)
+            results[f'{name}/throughput'] = throughput_result(
+                len(times) / elapsed, 'requests/s')
+            print(f"{workers} workers, {mode}: median "
+                  f"{results[f'{name}/latency']['value']:.0f} ms, p95 "
+                  f"{results[f'{name}/latency']['p95']:.0f} ms, "
+                  f"{len(times) / elapsed:.2f} requests/s")
+
+    print(f"Thread budget for 1 worker on this host: {thread_budget(1)}")
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import torch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_package(name):
+    # Each benchmark process imports the flat modules of exactly one of
+    # training/ and deployment/. Both use the shared preprocessing and
+    # modeling packages at the root
+    sys.path.insert(0, os.path.join(REPO_ROOT, name))
+    if REPO_ROOT not in sys.path:
+        sys.path.append(REPO_ROOT)
+
+
+def available_devices():
+    devices = ['cpu']
+    if torch.cuda.is_available():
+        devices.append('cuda')
+    return devices
+
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def measure(fn, warmup=2, repeats=10, device='cpu'):
+    for _ in range(warmup):
+        fn()
+    synchronize(device)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def latency_result(times_ms):
+    return {
+        'value': float(np.median(times_ms)),
+        'unit': 'ms',
+        'lower_is_better': True,
+        'p95': float(np.percentile(times_ms, 95)),
+        'mean': float(np.mean(times_ms)),
+        'repeats': len(times_ms)
+    }
+
+
+def throughput_result(value, unit):
+    return {'value': float(value), 'unit': unit, 'lower_is_better': False}
+
+
+def environment():
+    env = {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads()
+    }
+    if torch.cuda.is_available():
+        env['gpu'] = torch.cuda.get_device_name(0)
+    return env
+
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
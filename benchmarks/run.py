@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import environment, write_results
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SUITES = ['dataset', 'model', 'inference', 'threads']
+
+
+def suite_args(suite, args):
+    if suite == 'dataset':
+        return ['--data-dir', os.path.join(args.data_dir, suite),
+                '--num-clips', str(args.num_clips)]
+    if suite == 'model':
+        return (['--architecture', args.architecture,
+                 '--repeats', str(args.repeats), '--batch-sizes']
+                + [str(b) for b in args.batch_sizes])
+    if suite == 'threads':
+        return (['--data-dir', os.path.join(args.data_dir, suite),
+                 '--architecture', args.architecture,
+                 '--repeats', str(args.repeats), '--workers']
+                + [str(w) for w in args.workers])
+    extra = (['--data-dir', os.path.join(args.data_dir, suite),
+              '--architecture', args.architecture,
+              '--repeats', str(args.repeats), '--video-lengths']
+             + [str(length) for length in args.video_lengths])
+    if args.whisper_model:
+        extra += ['--whisper-model', args.whisper_model,
+                  '--transcriber-backend', args.transcriber_backend]
+        if args.no_word_timestamps:
+            extra.append('--no-word-timestamps')
+        if args.vad:
+            extra.append('--vad')
+    return extra
+
+
+def run_suite(suite, args):
+    # Separate processes: the training and deployment packages both define
+    # a top-level models module
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, 'results.json')
+        command = [sys.executable, os.path.join(BENCHMARKS_DIR, f'bench_{suite}.py'),
+                   '--output', output] + suite_args(suite, args)
+
+        print(f"Running {suite} benchmarks...")
+        subprocess.run(command, check=True)
+        with open(output) as f:
+            return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    # A benchmark regresses when it is more than tolerance worse than the
+    # baseline in its own direction (latency up, throughput down)
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            print(f"{name:45s} {result['value']:10.2f} {result['unit']:10s} (new)")
+            continue
+
+        base_value = baseline[name]['value']
+        change = (result['value'] - base_value) / base_value if base_value else 0.0
+        worse = change > tolerance if result['lower_is_better'] else change < -tolerance
+        status = "REGRESSION" if worse else "ok"
+        print(f"{name:45s} {result['value']:10.2f} {result['unit']:10s} "
+              f"{change:+7.1%}  {status}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suites", type=str, nargs="+", default=SUITES,
+                        choices=SUITES)
+    parser.add_argument("--data-dir", type=str, default="/tmp/benchmark_data")
+    parser.add_argument("--output", type=str, default="benchmark_results.json")
+    # Recorded with --update-baseline on the reference machine
+    parser.add_argument("--baseline", type=str,
+                        default=os.path.join(BENCHMARKS_DIR, 'baseline.json'))
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--update-baseline", action="store_true")
+
+    # Model and workload sizes, passed on to the suites that use them
+    parser.add_argument("--architecture", type=str, default="multimodal",
+                        choices=["multimodal", "student"])
+    parser.add_argument("--num-clips", type=int, default=16)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--video-lengths", type=float, nargs="+", default=[5, 15])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Concurrent worker processes for the threads suite")
+    parser.add_argument("--whisper-model", type=str, default=None)
+    parser.add_argument("--transcriber-backend", type=str, default="whisper")
+    parser.add_argument("--no-word-timestamps", action="store_true")
+    parser.add_argument("--vad", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for suite in args.suites:
+        results.update(run_suite(suite, args))
+
+    write_results(args.output, {'environment': environment(),
+                                'benchmarks': results})
+    print(f"Results written to {args.output}")
+
+    if args.baseline and args.update_baseline:
+        write_results(args.baseline, {'environment': environment(),
+                                      'benchmarks': results})
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored['benchmarks']
+        # Timings only compare on the same hardware and library versions
+        current = environment()
+        changed = {key for key in set(stored['environment']) | set(current)
+                   if stored['environment'].get(key) != current.get(key)}
+        if changed:
+            print(f"Warning: the baseline was recorded in a different environment "
+                  f"({', '.join(sorted(changed))}), rerun with --update-baseline "
+                  f"on this machine first")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than "
+              f"{args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
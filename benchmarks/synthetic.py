@@ -0,0 +1,46 @@
+import os
+import subprocess
+import pandas as pd
+
+EMOTIONS = ['anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise']
+SENTIMENTS = ['negative', 'neutral', 'positive']
+
+
+def make_clip(path, duration, size="640x360", fps=24):
+    # Test pattern video with a sine tone, so every stage of the pipeline
+    # (frame decoding, audio extraction, mel spectrogram) has real work
+    if os.path.exists(path):
+        return path
+    subprocess.run([
+        'ffmpeg',
+        '-f', 'lavfi', '-i', f'testsrc=size={size}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-shortest',
+        '-y', path
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return path
+
+
+def make_dataset(root, num_clips, duration=3.0):
+    # Laid out like a MELD split: <root>/clips.csv and <root>/clips/
+    video_dir = os.path.join(root, 'clips')
+    os.makedirs(video_dir, exist_ok=True)
+
+    rows = []
+    for i in range(num_clips):
+        rows.append({
+            'Sr No.': i + 1,
+            'Utterance': 'This is a synthetic utterance for benchmarking.',
+            'Speaker': 'Bench',
+            'Emotion': EMOTIONS[i % len(EMOTIONS)],
+            'Sentiment': SENTIMENTS[i % len(SENTIMENTS)],
+            'Dialogue_ID': i,
+            'Utterance_ID': 0
+        })
+        make_clip(os.path.join(video_dir, f'dia{i}_utt0.mp4'), duration)
+
+    csv_path = os.path.join(root, 'clips.csv')
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+    return csv_path, video_dir
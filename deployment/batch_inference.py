@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+from inference import (load_models, download_from_s3, transcribe_video,
+                       prepare_segment, predict_batch, format_utterance,
+                       VideoUtteranceProcessor)
+from telemetry import RequestTimer
+from segments import postprocess_segments
+
+
+def read_manifest(manifest_path):
+    # One local path or s3:// URI per line, or a JSON lines file with a
+    # "video_path" field
+    videos = []
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                line = json.loads(line)['video_path']
+            videos.append(line)
+    return videos
+
+
+def progress_path_for(output_path):
+    # Parquet cannot be appended to, so results are collected as JSON lines
+    # and converted once every video is done
+    if output_path.endswith('.parquet'):
+        return output_path + '.partial.jsonl'
+    return output_path
+
+
+def completed_videos(progress_path):
+    # Videos that failed are retried on the next run
+    done = set()
+    if not os.path.exists(progress_path):
+        return done
+    with open(progress_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A record cut off by an interrupted run
+                continue
+            if record.get('error') is None:
+                done.add(record['video_path'])
+    return done
+
+
+def write_parquet(progress_path, output_path):
+    import pandas as pd
+
+    records = {}
+    with open(progress_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # The last attempt of a retried video wins
+            records[record['video_path']] = record
+
+    data = pd.DataFrame([{
+        'video_path': record['video_path'],
+        'utterances': json.dumps(record['utterances']),
+        'error': record['error']
+    } for record in records.values()])
+    data.to_parquet(output_path, index=False)
+
+
+class SegmentProducer:
+    # Worker threads download, transcribe and preprocess videos, and put
+    # every prepared segment on a bounded queue. ffmpeg and OpenCV release
+    # the GIL, so threads are enough to keep several videos in flight
+    def __init__(self, model_dict, segment_queue):
+        self.model_dict = model_dict
+        self.segment_queue = segment_queue
+        self.utterance_processor = VideoUtteranceProcessor(
+            model_dict.get('preprocessing'))
+        # Whisper installs decoding hooks on the shared model, so only one
+        # transcription runs at a time
+        self.transcribe_lock = threading.Lock()
+
+    def __call__(self, video_idx, video_uri):
+        local_path = None
+        prepared = 0
+        timer = RequestTimer()
+        try:
+            if video_uri.startswith('s3://'):
+                with timer.stage('download'):
+                    local_path = download_from_s3(video_uri)
+                video_path = local_path
+            else:
+                video_path = video_uri
+
+            with self.transcribe_lock:
+                segments = transcribe_video(video_path, self.model_dict, timer)
+            segments = postprocess_segments(segments)
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                for segment in segments:
+                    try:
+                        inputs = prepare_segment(
+                            video_path, segment, self.model_dict['tokenizer'],
+                            self.utterance_processor, temp_dir, timer)
+                    except Exception as e:
+                        print(f"Segment failed inference in {video_uri}: {e}")
+                        continue
+                    self.segment_queue.put(('segment', video_idx, segment, inputs))
+                    prepared += 1
+
+            self.segment_queue.put(('done', video_idx, prepared, None))
+        except Exception as e:
+            self.segment_queue.put(('done', video_idx, prepared, str(e)))
+        finally:
+            if local_path is not None and os.path.exists(local_path):
+                os.remove(local_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", type=str, required=True)
+    parser.add_argument("--model-dir", type=str, required=True)
+    parser.add_argument("--output", type=str, required=True,
+                        help="Results as .jsonl, or .parquet")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Segments per model forward, across videos")
+    args = parser.parse_args()
+
+    videos = read_manifest(args.manifest)
+    progress_path = progress_path_for(args.output)
+    done = completed_videos(progress_path)
+    todo = [(idx, uri) for idx, uri in enumerate(videos) if uri not in done]
+    print(f"{len(videos)} videos in manifest, {len(done)} already done, "
+          f"{len(todo)} to process")
+
+    # The producer threads' ffmpeg and OpenCV calls and the model share the
+    # cores, so they are budgeted as if the threads were workers
+    model_dict = load_models(args.model_dir, workers=args.workers)
+    model = model_dict['model']
+    device = model_dict['device']
+
+    # Bounded, so decoded clips never pile up faster than the model runs
+    segment_queue = queue.Queue(maxsize=args.batch_size * 4)
+    producer = SegmentProducer(model_dict, segment_queue)
+
+    # Per video: utterances so far, segments still expected (known once the
+    # worker reports done) and the error, if any
+    results = {idx: {'utterances': [], 'expected': None, 'error': None}
+               for idx, _ in todo}
+    batch = []
+    batch_timer = RequestTimer()
+    remaining = len(todo)
+
+    with open(progress_path, 'a') as output, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor, \
+            tqdm(total=len(todo), desc="Videos") as progress:
+        for idx, uri in todo:
+            executor.submit(producer, idx, uri)
+
+        def finish_ready(video_indices):
+            nonlocal remaining
+            for idx in video_indices:
+                result = results[idx]
+                if result['expected'] is None or len(result['utterances']) < result['expected']:
+                    continue
+                output.write(json.dumps({
+                    'video_path': videos[idx],
+                    'utterances': sorted(result['utterances'],
+                                         key=lambda u: u['start_time']),
+                    'error': result['error']
+                }) + '\n')
+                output.flush()
+                del results[idx]
+                remaining -= 1
+                progress.update(1)
+
+        def run_batch():
+            scores = predict_batch(model, device,
+                                   [inputs for _, _, inputs in batch], batch_timer)
+            for (idx, segment, _), segment_scores in zip(batch, scores):
+                results[idx]['utterances'].append(
+                    format_utterance(segment, segment_scores))
+            finished = {idx for idx, _, _ in batch}
+            batch.clear()
+            finish_ready(finished)
+
+        while remaining > 0:
+            try:
+                item = segment_queue.get(timeout=1.0)
+            except queue.Empty:
+                # Workers are busy transcribing; run what is there rather
+                # than wait for a full batch
+                if batch:
+                    run_batch()
+                continue
+
+            if item[0] == 'segment':
+                _, idx, segment, inputs = item
+                batch.append((idx, segment, inputs))
+                if len(batch) >= args.batch_size:
+                    run_batch()
+            else:
+                # Segments still in the batch complete the video when the
+                # batch runs
+                _, idx, prepared, error = item
+                results[idx]['expected'] = prepared
+                results[idx]['error'] = error
+                if error is not None:
+                    print(f"Failed {videos[idx]}: {error}")
+                finish_ready([idx])
+
+    if args.output.endswith('.parquet'):
+        write_parquet(progress_path, args.output)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
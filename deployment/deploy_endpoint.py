@@ -1,11 +1,27 @@
 from sagemaker.pytorch import PyTorchModel
 import sagemaker
 
-def deploy_endpoint():
+def deploy_endpoint(model_load_mode="default", model_server_workers=None,
+                    transcriber_backend="whisper", transcriber_model="base",
+                    word_timestamps=True, vad=False):
     sagemaker.Session()
     role = "arn:aws:iam::767397834308:role/sentiment-analysis-deploy-endpoint-role"
 
     model_uri = "s3://sentiment-analysis-saas-ml/inference/model.tar.gz"
+
+    # MODEL_LOAD_MODE=mmap lets several model-server workers share weights
+    env = {"MODEL_LOAD_MODE": model_load_mode}
+    # Transcription speed/quality trade-off, see transcribers.py
+    env.update({
+        "TRANSCRIBER_BACKEND": transcriber_backend,
+        "TRANSCRIBER_MODEL": transcriber_model,
+        "TRANSCRIBER_WORD_TIMESTAMPS": "1" if word_timestamps else "0",
+        "TRANSCRIBER_VAD": "1" if vad else "0"
+    })
+    # Unset, inference.py assumes the model server's own default of one
+    # worker per GPU or vCPU when budgeting threads
+    if model_server_workers is not None:
+        env["SAGEMAKER_MODEL_SERVER_WORKERS"] = str(model_server_workers)
     
     model = PyTorchModel(
         model_data = model_uri,
@@ -14,6 +30,9 @@ def deploy_endpoint():
         py_version = "py311",
         entry_point = "inference.py",
         source_dir = ".",
+        # Shared with training, copied next to inference.py
+        dependencies = ["../preprocessing", "../modeling"],
+        env = env,
         name = "sentiment-analysis-endpoint"
     )
     
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tqdm import tqdm
+
+from inference import load_models, embed_batch, EMBEDDING_DIMS, EMBEDDING_PARTS
+from batch_inference import read_manifest, SegmentProducer
+from telemetry import RequestTimer
+from embedding_search import EMBEDDINGS_NAME, SEGMENTS_NAME, LAYOUT_NAME
+
+
+def column_layout(parts):
+    layout = {}
+    start = 0
+    for part in parts:
+        layout[part] = [start, start + EMBEDDING_DIMS[part]]
+        start += EMBEDDING_DIMS[part]
+    return layout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", type=str, required=True)
+    parser.add_argument("--model-dir", type=str, required=True)
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--parts", type=str, nargs="+", default=list(EMBEDDING_PARTS),
+                        choices=list(EMBEDDING_DIMS),
+                        help="Feature groups to store, side by side")
+    args = parser.parse_args()
+
+    videos = read_manifest(args.manifest)
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Embedding {len(videos)} videos")
+
+    model_dict = load_models(args.model_dir, workers=args.workers)
+    model = model_dict['model']
+    device = model_dict['device']
+
+    segment_queue = queue.Queue(maxsize=args.batch_size * 4)
+    producer = SegmentProducer(model_dict, segment_queue)
+
+    chunks = []
+    batch = []
+    failed = {}
+    timer = RequestTimer()
+    remaining = len(videos)
+    segments_path = os.path.join(args.output_dir, SEGMENTS_NAME)
+
+    with open(segments_path + '.tmp', 'w') as segments_file, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor, \
+            tqdm(total=len(videos), desc="Videos") as progress:
+        for idx, uri in enumerate(videos):
+            executor.submit(producer, idx, uri)
+
+        def run_batch():
+            chunks.append(embed_batch(model, device,
+                                      [inputs for _, _, inputs in batch],
+                                      timer, parts=args.parts))
+            for idx, segment, _ in batch:
+                segments_file.write(json.dumps({
+                    'video_path': videos[idx],
+                    'start_time': segment['start'],
+                    'end_time': segment['end'],
+                    'text': segment['text']
+                }) + '\n')
+            batch.clear()
+
+        while remaining > 0:
+            try:
+                item = segment_queue.get(timeout=1.0)
+            except queue.Empty:
+                if batch:
+                    run_batch()
+                continue
+
+            if item[0] == 'segment':
+                _, idx, segment, inputs = item
+                batch.append((idx, segment, inputs))
+                if len(batch) >= args.batch_size:
+                    run_batch()
+            else:
+                _, idx, _, error = item
+                if error is not None:
+                    print(f"Failed {videos[idx]}: {error}")
+                    failed[videos[idx]] = error
+                remaining -= 1
+                progress.update(1)
+
+        # Every video is done, so nothing else joins the last batch
+        if batch:
+            run_batch()
+
+    dim = sum(EMBEDDING_DIMS[part] for part in args.parts)
+    embeddings = (np.concatenate(chunks) if chunks
+                  else np.zeros((0, dim), dtype=np.float16))
+
+    # Written under temporary names first, so a finished directory always
+    # has matching files
+    embeddings_path = os.path.join(args.output_dir, EMBEDDINGS_NAME)
+    with open(embeddings_path + '.tmp', 'wb') as f:
+        np.save(f, embeddings)
+    os.replace(embeddings_path + '.tmp', embeddings_path)
+    os.replace(segments_path + '.tmp', segments_path)
+
+    with open(os.path.join(args.output_dir, LAYOUT_NAME), 'w') as f:
+        json.dump({
+            'count': len(embeddings),
+            'dim': dim,
+            'dtype': 'float16',
+            'columns': column_layout(args.parts),
+            'model_dir': args.model_dir,
+            'failed': failed
+        }, f, indent=2)
+
+    print(f"{len(embeddings)} utterances from {len(videos) - len(failed)} videos "
+          f"embedded into {embeddings_path} ({embeddings.nbytes / 1024**2:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import numpy as np
+
+# Written by embed_corpus.py. Row i of embeddings.npy is the utterance on
+# line i of segments.jsonl, and embeddings.json says which columns hold
+# which feature group
+EMBEDDINGS_NAME = 'embeddings.npy'
+SEGMENTS_NAME = 'segments.jsonl'
+LAYOUT_NAME = 'embeddings.json'
+
+
+def load_embeddings(directory):
+    # The array stays memory-mapped; search reads it a chunk at a time
+    with open(os.path.join(directory, LAYOUT_NAME)) as f:
+        layout = json.load(f)
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_NAME), mmap_mode='r')
+    with open(os.path.join(directory, SEGMENTS_NAME)) as f:
+        segments = [json.loads(line) for line in f]
+    return embeddings, segments, layout
+
+
+def select_columns(embeddings, layout, parts):
+    columns = [np.arange(*layout['columns'][part]) for part in parts]
+    return embeddings[:, np.concatenate(columns)]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def nearest_neighbours(corpus, queries, k=10, chunk_size=65536):
+    # Exact cosine-similarity top-k. The corpus goes through in chunks so
+    # only chunk_size rows are upcast to float32 at a time. Returns
+    # [queries, k] scores and row indices, best first
+    queries = normalize(queries)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_indices = np.empty((len(queries), 0), dtype=np.int64)
+
+    for start in range(0, len(corpus), chunk_size):
+        block = normalize(corpus[start:start + chunk_size])
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        indices = np.concatenate([
+            best_indices,
+            np.broadcast_to(np.arange(start, start + len(block)),
+                            (len(queries), len(block)))], axis=1)
+
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            indices = np.take_along_axis(indices, top, axis=1)
+        best_scores, best_indices = scores, indices
+
+    order = np.argsort(-best_scores, axis=1)
+    return (np.take_along_axis(best_scores, order, axis=1),
+            np.take_along_axis(best_indices, order, axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embeddings-dir", type=str, required=True)
+    parser.add_argument("--query-rows", type=int, nargs="+", required=True,
+                        help="Rows of segments.jsonl to find neighbours for")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--parts", type=str, nargs="+", default=None,
+                        help="Feature groups to compare, default all stored")
+    args = parser.parse_args()
+
+    embeddings, segments, layout = load_embeddings(args.embeddings_dir)
+    parts = args.parts or list(layout['columns'])
+    if len(parts) != len(layout['columns']):
+        embeddings = select_columns(embeddings, layout, parts)
+
+    queries = np.asarray(embeddings[args.query_rows])
+    # One extra, as each query finds itself
+    scores, indices = nearest_neighbours(embeddings, queries, k=args.k + 1)
+
+    for row, row_scores, row_indices in zip(args.query_rows, scores, indices):
+        query = segments[row]
+        print(f"\n[{row}] {query['text']} ({query['video_path']} "
+              f"{query['start_time']:.1f}-{query['end_time']:.1f}s)")
+        for score, idx in [(s, i) for s, i in zip(row_scores, row_indices)
+                           if i != row][:args.k]:
+            match = segments[idx]
+            print(f"  {score:.3f} [{idx}] {match['text']} ({match['video_path']} "
+                  f"{match['start_time']:.1f}-{match['end_time']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,38 @@
 import torch
-from models import MultimodalSentimentModel
+import bootstrap  # noqa: F401
+from modeling import MODEL_CONFIG_NAME, MODEL_WEIGHTS_NAME
 import os
-import cv2
-import numpy as np
 import subprocess
-import torchaudio
-import whisper
 from transformers import AutoTokenizer
 import sys
 import json
 import boto3
 import tempfile
+import email
+import email.policy
+
+from telemetry import RequestTimer, TELEMETRY
+
+from preprocessing import (PreprocessingConfig, load_video_frames,
+                           extract_audio_features, tokenize, thread_budget,
+                           apply_thread_budget, ffmpeg_thread_args,
+                           available_cores)
+from model_loading import load_sentiment_model, MODEL_LOAD_MODE
+from transcribers import build_transcriber
+from segments import postprocess_segments
 
 EMOTION_MAP = {0: "anger", 1: "disgust", 2: "fear",
                3: "joy", 4: "neutral", 5: "sadness", 6: "surprise"}
 SENTIMENT_MAP = {0: "negative", 1: "neutral", 2: "positive"}
+SEGMENT_BATCH_SIZE = int(os.environ.get("SEGMENT_BATCH_SIZE", 8))
+# Model-server worker processes on this instance, which share its cores.
+# Unset, the model server starts one worker per GPU, or per vCPU without one
+MODEL_SERVER_WORKERS = int(os.environ.get(
+    "SAGEMAKER_MODEL_SERVER_WORKERS",
+    torch.cuda.device_count() or available_cores()))
+# Feature groups returned with return_features, and their widths
+EMBEDDING_DIMS = {"fused": 256, "text": 128, "video": 128, "audio": 128}
+EMBEDDING_PARTS = ("fused",)
 
 
 def install_ffmpeg():
@@ -70,105 +88,10 @@ def install_ffmpeg():
         return False
 
 
-class VideoProcessor:
-    def process_video(self, video_path):
-        cap = cv2.VideoCapture(video_path)
-        frames = []
-
-        try:
-            if not cap.isOpened():
-                raise ValueError(f"Video not found: {video_path}")
-
-            # Try and read first frame to validate video
-            ret, frame = cap.read()
-            if not ret or frame is None:
-                raise ValueError(f"Video not found: {video_path}")
-
-            # Reset index to not skip first frame
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-
-            while len(frames) < 30 and cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                frame = cv2.resize(frame, (224, 224))
-                frame = frame / 255.0
-                frames.append(frame)
-
-        except Exception as e:
-            raise ValueError(f"Video error: {str(e)}")
-        finally:
-            cap.release()
-
-        if (len(frames) == 0):
-            raise ValueError("No frames could be extracted")
-
-        # Pad or truncate frames
-        if len(frames) < 30:
-            frames += [np.zeros_like(frames[0])] * (30 - len(frames))
-        else:
-            frames = frames[:30]
-
-        # Before permute: [frames, height, width, channels]
-        # After permute: [frames, channels, height, width]
-        return torch.FloatTensor(np.array(frames)).permute(0, 3, 1, 2)
-
-
-class AudioProcessor:
-    def extract_features(self, video_path, max_length=300):
-        audio_path = video_path.replace('.mp4', '.wav')
-
-        try:
-            subprocess.run([
-                'ffmpeg',
-                '-i', video_path,
-                '-vn',
-                '-acodec', 'pcm_s16le',
-                '-ar', '16000',
-                '-ac', '1',
-                audio_path
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-            waveform, sample_rate = torchaudio.load(audio_path)
-
-            if sample_rate != 16000:
-                resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-                waveform = resampler(waveform)
-
-            mel_spectrogram = torchaudio.transforms.MelSpectrogram(
-                sample_rate=16000,
-                n_mels=64,
-                n_fft=1024,
-                hop_length=512
-            )
-
-            mel_spec = mel_spectrogram(waveform)
-
-            # Normalize
-            mel_spec = (mel_spec - mel_spec.mean()) / mel_spec.std()
-
-            if mel_spec.size(2) < 300:
-                padding = 300 - mel_spec.size(2)
-                mel_spec = torch.nn.functional.pad(mel_spec, (0, padding))
-            else:
-                mel_spec = mel_spec[:, :, :300]
-
-            return mel_spec
-
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Audio extraction error: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"Audio error: {str(e)}")
-        finally:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-
-
 class VideoUtteranceProcessor:
-    def __init__(self):
-        self.video_processor = VideoProcessor()
-        self.audio_processor = AudioProcessor()
+    def __init__(self, preprocessing=None):
+        # The PreprocessingConfig recorded with the model
+        self.preprocessing = preprocessing or PreprocessingConfig()
 
     def extract_segment(self, video_path, start_time, end_time, temp_dir="/tmp"):
         os.makedirs(temp_dir, exist_ok=True)
@@ -176,11 +99,12 @@ class VideoUtteranceProcessor:
             temp_dir, f"segment_{start_time}_{end_time}.mp4")
 
         subprocess.run([
-            "ffmpeg", "-i", video_path,
+            "ffmpeg", *ffmpeg_thread_args(), "-i", video_path,
             "-ss", str(start_time),
             "-to", str(end_time),
             "-c:v", "libx264",
             "-c:a", "aac",
+            *ffmpeg_thread_args(),
             "-y",
             segment_path
         ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
@@ -201,13 +125,78 @@ def download_from_s3(s3_uri):
         return temp_file.name
 
 
+def save_upload(data, filename=None):
+    suffix = os.path.splitext(filename or "")[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_file.write(data)
+        return temp_file.name
+
+
+def parse_multipart(request_body, content_type):
+    # {field name: (filename, bytes)} of a multipart/form-data body
+    message = email.message_from_bytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + request_body,
+        policy=email.policy.HTTP)
+    if not message.is_multipart():
+        raise ValueError("Malformed multipart body")
+    return {part.get_param("name", header="content-disposition"):
+            (part.get_filename(), part.get_payload(decode=True))
+            for part in message.iter_parts()}
+
+
+def parse_segments(segments):
+    # Caller-supplied transcript, e.g. from subtitles, in Whisper's format
+    parsed = []
+    for segment in segments:
+        start, end = float(segment["start"]), float(segment["end"])
+        if not 0 <= start < end:
+            raise ValueError(f"Invalid segment times: {start}-{end}")
+        parsed.append({"start": start, "end": end, "text": str(segment["text"])})
+    return parsed
+
+
 def input_fn(request_body, request_content_type):
-    if request_content_type == "application/json":
+    # application/json: {"video_path": s3_uri, "segments": [...]}
+    # video/* or application/octet-stream: the video itself
+    # multipart/form-data: a "video" file, and optionally a "metadata" JSON
+    # part with the same fields as the JSON request except video_path
+    # With segments (start, end, text) the video is not transcribed, and
+    # "return_embeddings": true adds each utterance's fused embedding
+    content_type = request_content_type.split(";")[0].strip().lower()
+    timer = RequestTimer()
+
+    if content_type == "application/json":
         input_data = json.loads(request_body)
-        s3_uri = input_data['video_path']
-        local_path = download_from_s3(s3_uri)
-        return {"video_path": local_path}
-    raise ValueError(f"Unsupported content type: {request_content_type}")
+        with timer.stage('download'):
+            local_path = download_from_s3(input_data['video_path'])
+    elif content_type.startswith("video/") or content_type == "application/octet-stream":
+        input_data = {}
+        with timer.stage('download'):
+            local_path = save_upload(request_body)
+    elif content_type == "multipart/form-data":
+        if isinstance(request_body, str):
+            request_body = request_body.encode("latin-1")
+        fields = parse_multipart(request_body, request_content_type)
+        if "video" not in fields:
+            raise ValueError("Multipart request has no video part")
+        input_data = json.loads(fields["metadata"][1]) if "metadata" in fields else {}
+        filename, data = fields["video"]
+        with timer.stage('download'):
+            local_path = save_upload(data, filename)
+    else:
+        raise ValueError(f"Unsupported content type: {request_content_type}")
+
+    segments = input_data.get('segments')
+    return {
+        "video_path": local_path,
+        "segments": parse_segments(segments) if segments is not None else None,
+        # input_fn's copy of the video, removed once predicted
+        "delete_video": True,
+        "timer": timer,
+        # Per-stage timings are only added to the response on request
+        "return_timings": bool(input_data.get('return_timings', False)),
+        "return_embeddings": bool(input_data.get('return_embeddings', False))
+    }
 
 
 def output_fn(prediction, response_content_type):
@@ -222,100 +211,191 @@ def model_fn(model_dir):
         raise RuntimeError(
             "FFmpeg installation failed - required for inference")
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = MultimodalSentimentModel().to(device)
+    return load_models(model_dir)
 
-    model_path = os.path.join(model_dir, 'model.pth')
-    if not os.path.exists(model_path):
-        model_path = os.path.join(model_dir, "model", 'model.pth')
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(
-                "Model file not found in path " + model_path)
 
-    print("Loading model from path: " + model_path)
-    model.load_state_dict(torch.load(
-        model_path, map_location=device, weights_only=True))
-    model.eval()
+def load_models(model_dir, workers=None):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    budget = apply_thread_budget(thread_budget(workers or MODEL_SERVER_WORKERS))
+    print(f"Thread budget: {budget}")
+
+    # model.safetensors is preferred, model.pth is the older full format
+    candidates = [os.path.join(directory, name)
+                  for directory in [model_dir, os.path.join(model_dir, "model")]
+                  for name in [MODEL_WEIGHTS_NAME, 'model.pth']]
+    model_path = next((path for path in candidates if os.path.exists(path)), None)
+    if model_path is None:
+        raise FileNotFoundError(
+            "Model file not found in path " + model_dir)
+
+    # Models trained before model_config.json existed are the full
+    # multimodal architecture
+    model_config = {}
+    config_path = os.path.join(os.path.dirname(model_path), MODEL_CONFIG_NAME)
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            model_config = json.load(f)
+    print(f"Model architecture: {model_config.get('architecture', 'multimodal')}")
+
+    print(f"Loading model from path: {model_path} ({MODEL_LOAD_MODE} mode)")
+    model, preprocessing_config = load_sentiment_model(
+        model_config, model_path, device)
+    print(f"Preprocessing: {preprocessing_config}")
 
     return {
         'model': model,
-        'tokenizer': AutoTokenizer.from_pretrained('bert-base-uncased'),
-        'transcriber': whisper.load_model(
-            "base",
-            device="cpu" if device.type == "cpu" else device,
-        ),
+        'preprocessing': preprocessing_config,
+        'tokenizer': AutoTokenizer.from_pretrained(preprocessing_config.tokenizer),
+        'transcriber': build_transcriber(device),
         'device': device
     }
 
 
-def predict_fn(input_data, model_dict):
-    model = model_dict['model']
-    tokenizer = model_dict['tokenizer']
-    device = model_dict['device']
-    video_path = input_data['video_path']
+def transcribe_video(video_path, model_dict, timer):
+    with timer.stage('transcribe'):
+        return model_dict['transcriber'].transcribe(video_path)
 
-    result = model_dict['transcriber'].transcribe(
-        video_path, word_timestamps=True)
 
-    utterance_processor = VideoUtteranceProcessor()
-    predictions = []
-
-    for segment in result["segments"]:
-        try:
+def prepare_segment(video_path, segment, tokenizer, utterance_processor,
+                    temp_dir, timer):
+    # Model inputs for one segment, without a batch dimension
+    segment_path = None
+    try:
+        with timer.stage('extract_segment'):
             segment_path = utterance_processor.extract_segment(
                 video_path,
                 segment["start"],
-                segment["end"]
+                segment["end"],
+                temp_dir=temp_dir
             )
 
-            video_frames = utterance_processor.video_processor.process_video(
-                segment_path)
-            audio_features = utterance_processor.audio_processor.extract_features(
-                segment_path)
-            text_inputs = tokenizer(
-                segment["text"],
-                padding="max_length",
-                truncation=True,
-                max_length=128,
-                return_tensors="pt"
-            )
+        config = utterance_processor.preprocessing
+        with timer.stage('video_frames'):
+            video_frames = load_video_frames(segment_path, config)
+        with timer.stage('audio_features'):
+            audio_features = extract_audio_features(segment_path, config)
+        with timer.stage('tokenize'):
+            text_inputs = tokenize(tokenizer, segment["text"], config)
+
+        return {
+            'text_inputs': text_inputs,
+            'video_frames': video_frames,
+            'audio_features': audio_features
+        }
+    finally:
+        # Cleanup
+        if segment_path is not None and os.path.exists(segment_path):
+            os.remove(segment_path)
+
+
+def stack_inputs(inputs, device):
+    # A batch from a list of prepare_segment outputs
+    text_inputs = {
+        'input_ids': torch.stack([i['text_inputs']['input_ids'] for i in inputs]).to(device),
+        'attention_mask': torch.stack([i['text_inputs']['attention_mask'] for i in inputs]).to(device)
+    }
+    video_frames = torch.stack([i['video_frames'] for i in inputs]).to(device)
+    audio_features = torch.stack([i['audio_features'] for i in inputs]).to(device)
+    return text_inputs, video_frames, audio_features
+
+
+def predict_batch(model, device, inputs, timer, return_embeddings=False):
+    # Top-3 emotions and sentiments for a list of prepare_segment outputs,
+    # and optionally the fused 256-d embedding of each
+    batch = stack_inputs(inputs, device)
+
+    # Includes the device sync of reading the results back
+    with timer.stage('model_forward'), torch.inference_mode():
+        outputs = model(*batch, return_features=return_embeddings)
+        emotion_probs = torch.softmax(outputs["emotions"], dim=1)
+        sentiment_probs = torch.softmax(outputs["sentiments"], dim=1)
+
+        emotion_values, emotion_indices = torch.topk(emotion_probs, 3)
+        sentiment_values, sentiment_indices = torch.topk(sentiment_probs, 3)
+        emotion_values = emotion_values.tolist()
+        emotion_indices = emotion_indices.tolist()
+        sentiment_values = sentiment_values.tolist()
+        sentiment_indices = sentiment_indices.tolist()
+        if return_embeddings:
+            embeddings = outputs["features"]["fused"].float().tolist()
+
+    results = [{
+        "emotions": [
+            {"label": EMOTION_MAP[idx], "confidence": conf} for idx, conf in zip(emotion_indices[i], emotion_values[i])
+        ],
+        "sentiments": [
+            {"label": SENTIMENT_MAP[idx], "confidence": conf} for idx, conf in zip(sentiment_indices[i], sentiment_values[i])
+        ]
+    } for i in range(len(inputs))]
+    if return_embeddings:
+        for result, embedding in zip(results, embeddings):
+            result["embedding"] = embedding
+    return results
+
+
+def embed_batch(model, device, inputs, timer, parts=EMBEDDING_PARTS):
+    # float16 [batch, dim] array of the requested feature groups side by side
+    batch = stack_inputs(inputs, device)
+    with timer.stage('model_forward'), torch.inference_mode():
+        features = model(*batch, return_features=True)["features"]
+        embeddings = torch.cat([features[part] for part in parts], dim=1)
+        return embeddings.half().cpu().numpy()
+
+
+def format_utterance(segment, scores):
+    return {
+        "start_time": segment["start"],
+        "end_time": segment["end"],
+        "text": segment["text"],
+        **scores
+    }
+
+
+def predict_fn(input_data, model_dict):
+    model = model_dict['model']
+    tokenizer = model_dict['tokenizer']
+    device = model_dict['device']
+    video_path = input_data['video_path']
+    timer = input_data.get('timer') or RequestTimer()
+    utterance_processor = VideoUtteranceProcessor(model_dict.get('preprocessing'))
+    predictions = []
 
-            # Move to device
-            text_inputs = {k: v.to(device) for k, v in text_inputs.items()}
-            video_frames = video_frames.unsqueeze(0).to(device)
-            audio_features = audio_features.unsqueeze(0).to(device)
-
-            # Get predictions
-            with torch.inference_mode():
-                outputs = model(text_inputs, video_frames, audio_features)
-                emotion_probs = torch.softmax(outputs["emotions"], dim=1)[0]
-                sentiment_probs = torch.softmax(
-                    outputs["sentiments"], dim=1)[0]
-
-                emotion_values, emotion_indices = torch.topk(emotion_probs, 3)
-                sentiment_values, sentiment_indices = torch.topk(
-                    sentiment_probs, 3)
-
-            predictions.append({
-                "start_time": segment["start"],
-                "end_time": segment["end"],
-                "text": segment["text"],
-                "emotions": [
-                    {"label": EMOTION_MAP[idx.item()], "confidence": conf.item()} for idx, conf in zip(emotion_indices, emotion_values)
-                ],
-                "sentiments": [
-                    {"label": SENTIMENT_MAP[idx.item()], "confidence": conf.item()} for idx, conf in zip(sentiment_indices, sentiment_values)
-                ]
-            })
-
-        except Exception as e:
-            print("Segment failed inference: " + str(e))
-
-        finally:
-            # Cleanup
-            if os.path.exists(segment_path):
-                os.remove(segment_path)
-    return {"utterances": predictions}
+    try:
+        segments = input_data.get('segments')
+        if segments is None:
+            segments = transcribe_video(video_path, model_dict, timer)
+        segments = postprocess_segments(segments)
+
+        # Segments go through the model SEGMENT_BATCH_SIZE at a time, which
+        # also bounds how many decoded clips are held in memory
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for start in range(0, len(segments), SEGMENT_BATCH_SIZE):
+                batch = []
+                for segment in segments[start:start + SEGMENT_BATCH_SIZE]:
+                    try:
+                        batch.append((segment, prepare_segment(
+                            video_path, segment, tokenizer, utterance_processor,
+                            temp_dir, timer)))
+                    except Exception as e:
+                        print("Segment failed inference: " + str(e))
+
+                if not batch:
+                    continue
+                scores = predict_batch(
+                    model, device, [inputs for _, inputs in batch], timer,
+                    return_embeddings=input_data.get('return_embeddings', False))
+                predictions += [format_utterance(segment, segment_scores)
+                                for (segment, _), segment_scores in zip(batch, scores)]
+    finally:
+        if input_data.get('delete_video') and os.path.exists(video_path):
+            os.remove(video_path)
+
+    TELEMETRY.observe(timer, len(segments))
+
+    response = {"utterances": predictions}
+    if input_data.get('return_timings'):
+        response["timings"] = timer.as_dict()
+    return response
 
 
 def process_local_video(video_path, model_dir="model_normalized"):
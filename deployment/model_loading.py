@@ -0,0 +1,94 @@
+import os
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+import bootstrap  # noqa: F401
+from modeling import build_model, load_model_weights
+from preprocessing import PreprocessingConfig
+
+# "mmap" memory-maps weights from their checkpoint files instead of reading
+# them into private memory. Model-server workers on one instance then share
+# the same page-cache pages, and startup skips the deserialization copy.
+# On a GPU each worker still needs its own device copy, mapping then only
+# saves the host-side one. "default" keeps the original loading path
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "default")
+
+
+def use_mmap():
+    return MODEL_LOAD_MODE == "mmap"
+
+
+def load_sentiment_model(model_config, model_path, device):
+    # Returns the model and the PreprocessingConfig its inputs need.
+    # model.safetensors is always mapped and carries its own model config.
+    # It holds every weight unless training ran with --omit-base-weights,
+    # then the frozen backbones are downloaded into private memory again
+    if model_path.endswith(".safetensors"):
+        model, metadata = load_model_weights(model_path, device)
+        return model, metadata["preprocessing"]
+
+    # model.pth files predate recorded preprocessing and used the defaults
+    if not use_mmap():
+        model = build_model(model_config).to(device)
+        model.load_state_dict(torch.load(
+            model_path, map_location=device, weights_only=True))
+        return model.eval(), PreprocessingConfig()
+
+    # model.pth holds every weight, including BERT and r3d_18, so the
+    # pretrained downloads are skipped. assign=True makes the parameters the
+    # mapped tensors themselves rather than copies. Not built on the meta
+    # device because BERT's non-persistent buffers are not in model.pth
+    model = build_model(model_config, pretrained=False)
+    state_dict = torch.load(model_path, map_location="cpu",
+                            mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    return model.to(device).eval(), PreprocessingConfig()
+
+
+def whisper_checkpoint_path(name):
+    default = os.path.join(os.path.expanduser("~"), ".cache")
+    download_root = os.path.join(os.getenv("XDG_CACHE_HOME", default), "whisper")
+    if name in whisper._MODELS:
+        return whisper._download(whisper._MODELS[name], download_root, False)
+    return name
+
+
+def float32_checkpoint(name):
+    # Whisper ships fp16 weights that load_model upcasts into a float32
+    # model. Assigning mapped tensors keeps their dtype, so the upcast is
+    # done once and stored next to the original checkpoint
+    source_path = whisper_checkpoint_path(name)
+    path = os.path.splitext(source_path)[0] + ".fp32.pt"
+    if os.path.exists(path):
+        return path
+
+    checkpoint = torch.load(source_path, map_location="cpu", weights_only=True)
+    checkpoint["model_state_dict"] = {
+        key: value.float() if value.is_floating_point() else value
+        for key, value in checkpoint["model_state_dict"].items()
+    }
+
+    # Workers starting together may all convert; each writes its own temp
+    # file and the rename is atomic
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(checkpoint, temp_path)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_whisper(name, device):
+    if not use_mmap():
+        return whisper.load_model(
+            name, device="cpu" if device.type == "cpu" else device)
+
+    checkpoint = torch.load(float32_checkpoint(name), map_location="cpu",
+                            mmap=True, weights_only=True)
+
+    # Built normally rather than on the meta device: the decoder's causal
+    # mask is a non-persistent buffer that the checkpoint cannot restore
+    model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    if name in whisper._ALIGNMENT_HEADS:
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[name])
+    return model.to(device)
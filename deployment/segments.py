@@ -0,0 +1,78 @@
+import os
+import re
+
+# Every segment costs an ffmpeg extraction and a model input, so segments
+# are tidied up before any of that. Empty and punctuation-only ones are
+# dropped, one longer than SEGMENT_MAX_SECONDS is split into equal parts,
+# one shorter than SEGMENT_MIN_SECONDS is merged with a neighbour less than
+# SEGMENT_MERGE_GAP_SECONDS away, and SEGMENT_MAX_COUNT > 0 keeps only that
+# many of the longest segments. 0 turns a rule off
+SEGMENT_MIN_SECONDS = float(os.environ.get("SEGMENT_MIN_SECONDS", 1.0))
+SEGMENT_MERGE_GAP_SECONDS = float(os.environ.get("SEGMENT_MERGE_GAP_SECONDS", 0.5))
+SEGMENT_MAX_SECONDS = float(os.environ.get("SEGMENT_MAX_SECONDS", 20.0))
+SEGMENT_MAX_COUNT = int(os.environ.get("SEGMENT_MAX_COUNT", 0))
+
+
+def has_words(text):
+    # Whisper emits empty and punctuation-only segments ("...", " -")
+    return re.search(r"\w", text) is not None
+
+
+def merge_short(segments, min_seconds, max_gap, max_seconds):
+    merged = []
+    for segment in segments:
+        if merged:
+            previous = merged[-1]
+            short = (segment["end"] - segment["start"] < min_seconds
+                     or previous["end"] - previous["start"] < min_seconds)
+            close = segment["start"] - previous["end"] <= max_gap
+            fits = not max_seconds or segment["end"] - previous["start"] <= max_seconds
+            if short and close and fits:
+                merged[-1] = {"start": previous["start"], "end": segment["end"],
+                              "text": previous["text"].rstrip() + " " + segment["text"].lstrip()}
+                continue
+        merged.append(dict(segment))
+    return merged
+
+
+def split_long(segment, max_seconds):
+    duration = segment["end"] - segment["start"]
+    parts = int(-(-duration // max_seconds))
+    if parts <= 1:
+        return [segment]
+
+    # Without word timings the words are shared out evenly over the parts
+    words = segment["text"].split()
+    part_seconds = duration / parts
+    return [{
+        "start": segment["start"] + i * part_seconds,
+        "end": segment["start"] + (i + 1) * part_seconds,
+        "text": " ".join(words[len(words) * i // parts:len(words) * (i + 1) // parts])
+    } for i in range(parts)]
+
+
+def postprocess_segments(segments, min_seconds=None, max_gap=None,
+                         max_seconds=None, max_count=None):
+    # Arguments left as None come from the SEGMENT_* environment
+    min_seconds = SEGMENT_MIN_SECONDS if min_seconds is None else min_seconds
+    max_gap = SEGMENT_MERGE_GAP_SECONDS if max_gap is None else max_gap
+    max_seconds = SEGMENT_MAX_SECONDS if max_seconds is None else max_seconds
+    max_count = SEGMENT_MAX_COUNT if max_count is None else max_count
+
+    segments = sorted(
+        (segment for segment in segments
+         if has_words(segment["text"]) and segment["end"] > segment["start"]),
+        key=lambda segment: segment["start"])
+
+    if max_seconds:
+        segments = [part for segment in segments
+                    for part in split_long(segment, max_seconds)
+                    if has_words(part["text"])]
+    if min_seconds:
+        segments = merge_short(segments, min_seconds, max_gap, max_seconds)
+
+    if max_count and len(segments) > max_count:
+        longest = sorted(segments, key=lambda s: s["end"] - s["start"],
+                         reverse=True)[:max_count]
+        segments = sorted(longest, key=lambda segment: segment["start"])
+    return segments
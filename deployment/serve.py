@@ -0,0 +1,81 @@
+import argparse
+import os
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One process serves every request, so it gets every core's thread budget
+os.environ.setdefault("SAGEMAKER_MODEL_SERVER_WORKERS", "1")
+
+from inference import model_fn, input_fn, predict_fn, output_fn  # noqa: E402
+from telemetry import TELEMETRY  # noqa: E402
+from preprocessing import tokenize  # noqa: E402
+
+
+# Local stand-in for the SageMaker inference container: /ping,
+# /invocations, and /metrics in the Prometheus text format
+class InferenceHandler(BaseHTTPRequestHandler):
+    # Shared by the request threads, which run concurrently. Each request
+    # extracts its segments into its own temp directory, the model only runs
+    # under inference_mode, and the Whisper transcriber serializes its calls
+    model_dict = None
+
+    def _respond(self, status, body, content_type):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/ping':
+            self._respond(200, '', 'text/plain')
+        elif self.path == '/metrics':
+            self._respond(200, TELEMETRY.render_prometheus(),
+                          'text/plain; version=0.0.4')
+        else:
+            self._respond(404, 'Not found', 'text/plain')
+
+    def do_POST(self):
+        if self.path != '/invocations':
+            self._respond(404, 'Not found', 'text/plain')
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request_body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', 'application/json')
+        accept = self.headers.get('Accept', 'application/json')
+        if accept == '*/*':
+            accept = 'application/json'
+
+        try:
+            input_data = input_fn(request_body, content_type)
+            prediction = predict_fn(input_data, self.model_dict)
+            self._respond(200, output_fn(prediction, accept), accept)
+        except Exception as e:
+            TELEMETRY.observe_error()
+            traceback.print_exc()
+            self._respond(500, str(e), 'text/plain')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default="model_normalized")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    model_dict = model_fn(args.model_dir)
+    # A fast tokenizer stores its padding settings on first use, which
+    # concurrent first requests would otherwise race to set
+    tokenize(model_dict['tokenizer'], '', model_dict['preprocessing'])
+    InferenceHandler.model_dict = model_dict
+
+    server = ThreadingHTTPServer((args.host, args.port), InferenceHandler)
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
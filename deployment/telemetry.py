@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import numpy as np
+
+STAGES = ['download', 'transcribe', 'extract_segment', 'video_frames',
+          'audio_features', 'tokenize', 'model_forward']
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+class RequestTimer:
+    # Wall-clock time per stage of one request. Stages that run once per
+    # segment accumulate over all segments
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        timings = {f'{name}_ms': seconds * 1000
+                   for name, seconds in self.stages.items()}
+        timings['total_ms'] = self.total() * 1000
+        return timings
+
+
+class Telemetry:
+    # Aggregates finished requests. Quantiles are computed over the last
+    # window requests, counts and sums cover the process lifetime
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.errors = 0
+
+    def _add(self, key, value):
+        self.samples[key].append(value)
+        self.sums[key] += value
+        self.counts[key] += 1
+
+    def observe(self, timer, num_segments):
+        with self.lock:
+            for name, seconds in timer.stages.items():
+                self._add(('stage', name), seconds)
+            self._add(('stage', 'total'), timer.total())
+            self._add(('segments', None), num_segments)
+
+    def observe_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def _summary(self, metric, labels, key):
+        lines = []
+        values = list(self.samples[key])
+        for quantile in QUANTILES:
+            value = float(np.quantile(values, quantile)) if values else float('nan')
+            label_text = ','.join(labels + [f'quantile="{quantile}"'])
+            lines.append(f'{metric}{{{label_text}}} {value}')
+        suffix = '{' + ','.join(labels) + '}' if labels else ''
+        lines.append(f'{metric}_sum{suffix} {self.sums[key]}')
+        lines.append(f'{metric}_count{suffix} {self.counts[key]}')
+        return lines
+
+    def render_prometheus(self):
+        with self.lock:
+            lines = [
+                '# HELP inference_stage_seconds Time spent per inference stage and request.',
+                '# TYPE inference_stage_seconds summary'
+            ]
+            stage_names = STAGES + sorted(
+                name for kind, name in self.samples
+                if kind == 'stage' and name not in STAGES)
+            for name in stage_names:
+                if ('stage', name) in self.samples:
+                    lines += self._summary('inference_stage_seconds',
+                                           [f'stage="{name}"'], ('stage', name))
+
+            lines += [
+                '# HELP inference_segments_per_request Transcribed segments per request.',
+                '# TYPE inference_segments_per_request summary'
+            ]
+            lines += self._summary('inference_segments_per_request', [],
+                                   ('segments', None))
+
+            lines += [
+                '# HELP inference_errors_total Requests that raised an error.',
+                '# TYPE inference_errors_total counter',
+                f'inference_errors_total {self.errors}'
+            ]
+            return '\n'.join(lines) + '\n'
+
+
+# One registry per serving process
+TELEMETRY = Telemetry()
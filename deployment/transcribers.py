@@ -0,0 +1,130 @@
+import os
+import threading
+import numpy as np
+import whisper
+
+from model_loading import load_whisper
+
+# Transcription is usually the slowest stage of a request. Every deployment
+# picks its own trade-off through these, e.g. TRANSCRIBER_MODEL=tiny or
+# TRANSCRIBER_BACKEND=faster-whisper (int8 CTranslate2 on CPU, needs the
+# faster-whisper package). The defaults are the original Whisper "base" with
+# word timestamps
+TRANSCRIBER_BACKEND = os.environ.get("TRANSCRIBER_BACKEND", "whisper")
+TRANSCRIBER_MODEL = os.environ.get("TRANSCRIBER_MODEL", "base")
+TRANSCRIBER_COMPUTE_TYPE = os.environ.get("TRANSCRIBER_COMPUTE_TYPE")
+# Word timestamps tighten segment boundaries, at the cost of an extra
+# alignment pass. Skipping silence helps videos with long quiet stretches
+TRANSCRIBER_WORD_TIMESTAMPS = os.environ.get(
+    "TRANSCRIBER_WORD_TIMESTAMPS", "1") == "1"
+TRANSCRIBER_VAD = os.environ.get("TRANSCRIBER_VAD", "0") == "1"
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+VAD_FRAME_SECONDS = 0.03
+# Frames within this many dB of the loudest one count as speech
+VAD_DYNAMIC_RANGE_DB = 35
+VAD_FLOOR_DB = -60
+VAD_PADDING_SECONDS = 0.3
+VAD_MIN_SILENCE_SECONDS = 1.0
+
+
+def speech_regions(audio):
+    # (start, end) seconds of the parts of a 16 kHz waveform loud enough to
+    # hold speech, by frame energy. Short pauses stay inside a region
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    num_frames = len(audio) // frame
+    if num_frames == 0:
+        return []
+
+    frames = audio[:num_frames * frame].reshape(num_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    threshold = max(energy_db.max() - VAD_DYNAMIC_RANGE_DB, VAD_FLOOR_DB)
+    voiced = np.flatnonzero(energy_db > threshold)
+
+    duration = len(audio) / SAMPLE_RATE
+    regions = []
+    for idx in voiced:
+        start = max(idx * VAD_FRAME_SECONDS - VAD_PADDING_SECONDS, 0.0)
+        end = min((idx + 1) * VAD_FRAME_SECONDS + VAD_PADDING_SECONDS, duration)
+        if regions and start - regions[-1][1] < VAD_MIN_SILENCE_SECONDS:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(start, end) for start, end in regions]
+
+
+class WhisperTranscriber:
+    def __init__(self, model_name, device, word_timestamps=True, vad=False):
+        self.model = load_whisper(model_name, device)
+        self.word_timestamps = word_timestamps
+        self.vad = vad
+        # Whisper keeps its key/value cache and word alignments in hooks on
+        # the shared model's attention layers, so two transcriptions running
+        # at once in one process would mix them up
+        self.lock = threading.Lock()
+
+    def transcribe(self, video_path):
+        options = {'word_timestamps': self.word_timestamps}
+        audio = video_path
+        if self.vad:
+            audio = whisper.load_audio(video_path)
+            regions = speech_regions(audio)
+            if not regions:
+                return []
+            # Whisper only decodes inside these windows
+            options['clip_timestamps'] = [t for region in regions for t in region]
+
+        with self.lock:
+            result = self.model.transcribe(audio, **options)
+        return [{'start': segment['start'], 'end': segment['end'],
+                 'text': segment['text']} for segment in result['segments']]
+
+
+class FasterWhisperTranscriber:
+    def __init__(self, model_name, device, word_timestamps=True, vad=False,
+                 compute_type=None):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ImportError("TRANSCRIBER_BACKEND=faster-whisper needs the "
+                              "faster-whisper package")
+
+        if compute_type is None:
+            compute_type = "int8" if device.type == "cpu" else "float16"
+        self.model = WhisperModel(model_name, device=device.type,
+                                  compute_type=compute_type)
+        self.word_timestamps = word_timestamps
+        self.vad = vad
+
+    def transcribe(self, video_path):
+        # Uses faster-whisper's own Silero VAD for skipping silence
+        segments, _ = self.model.transcribe(
+            video_path, word_timestamps=self.word_timestamps,
+            vad_filter=self.vad)
+        return [{'start': segment.start, 'end': segment.end,
+                 'text': segment.text} for segment in segments]
+
+
+TRANSCRIBERS = {
+    'whisper': WhisperTranscriber,
+    'faster-whisper': FasterWhisperTranscriber
+}
+
+
+def build_transcriber(device, backend=None, model_name=None,
+                      word_timestamps=None, vad=None):
+    # Arguments left as None come from the TRANSCRIBER_* environment
+    backend = backend or TRANSCRIBER_BACKEND
+    if backend not in TRANSCRIBERS:
+        raise ValueError(f"Unknown transcriber backend: {backend}")
+
+    options = {
+        'word_timestamps': TRANSCRIBER_WORD_TIMESTAMPS
+        if word_timestamps is None else word_timestamps,
+        'vad': TRANSCRIBER_VAD if vad is None else vad
+    }
+    if backend == 'faster-whisper':
+        options['compute_type'] = TRANSCRIBER_COMPUTE_TYPE
+
+    print(f"Transcriber: {backend} {model_name or TRANSCRIBER_MODEL} {options}")
+    return TRANSCRIBERS[backend](model_name or TRANSCRIBER_MODEL, device, **options)
@@ -0,0 +1,17 @@
+# The model architectures and their model.safetensors format, shared by
+# training/ and deployment/. A checkpoint only loads into the exact classes
+# it was trained with, so there is only this one copy
+from .models import (TextEncoder, VideoEncoder, AudioEncoder,
+                     MultimodalFusionModel, MultimodalSentimentModel,
+                     StudentTextEncoder, StudentVideoEncoder,
+                     StudentSentimentModel, ARCHITECTURES, MODEL_CONFIG_NAME,
+                     build_model, is_frozen, frozen_context, frozen_submodules)
+from .model_io import (MODEL_WEIGHTS_NAME, save_model_weights, read_metadata,
+                       load_model_weights)
+
+__all__ = ['TextEncoder', 'VideoEncoder', 'AudioEncoder', 'MultimodalFusionModel',
+           'MultimodalSentimentModel', 'StudentTextEncoder', 'StudentVideoEncoder',
+           'StudentSentimentModel', 'ARCHITECTURES', 'MODEL_CONFIG_NAME',
+           'build_model', 'is_frozen', 'frozen_context', 'frozen_submodules',
+           'MODEL_WEIGHTS_NAME', 'save_model_weights', 'read_metadata',
+           'load_model_weights']
@@ -0,0 +1,97 @@
+import json
+import os
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
+
+from preprocessing import PreprocessingConfig
+from .models import build_model, is_frozen
+
+# model.safetensors holds every weight by default, so loading needs no
+# download and its tensors are memory-mapped straight from the file, shared
+# between the processes that load it. With include_base_weights=False the
+# frozen weights of pretrained submodules (BERT, r3d_18) are left out and
+# listed in the metadata with their source instead, for a much smaller
+# file; loading then takes them from the pretrained download again
+MODEL_WEIGHTS_NAME = 'model.safetensors'
+FORMAT_VERSION = 1
+
+
+def trained_state_dict(model):
+    # The state dict without frozen base weights, and the left out prefixes
+    base_weights = getattr(model, 'base_weights', {})
+    modules = dict(model.named_modules())
+    state_dict = {}
+    omitted = {}
+
+    for name, tensor in model.state_dict().items():
+        prefix = next((p for p in base_weights if name.startswith(p + '.')), None)
+        owner = modules[name.rsplit('.', 1)[0]]
+        # Fine-tuned stages and new heads inside a pretrained backbone are
+        # not frozen and are kept
+        if prefix is not None and is_frozen(owner):
+            omitted[prefix] = base_weights[prefix]
+            continue
+        state_dict[name] = tensor.detach().cpu().contiguous()
+
+    return state_dict, omitted
+
+
+def save_model_weights(model, path, model_config, preprocessing=None,
+                       include_base_weights=True):
+    # preprocessing is the PreprocessingConfig the model was trained with
+    preprocessing = preprocessing or PreprocessingConfig()
+    if include_base_weights:
+        state_dict = {name: tensor.detach().cpu().contiguous()
+                      for name, tensor in model.state_dict().items()}
+        base_weights = {}
+    else:
+        state_dict, base_weights = trained_state_dict(model)
+    # safetensors metadata values are strings
+    metadata = {
+        'format_version': str(FORMAT_VERSION),
+        'model_config': json.dumps(model_config),
+        'base_weights': json.dumps(base_weights),
+        'preprocessing': json.dumps(preprocessing.to_dict())
+    }
+
+    temp_path = path + '.tmp'
+    save_file(state_dict, temp_path, metadata=metadata)
+    os.replace(temp_path, path)
+    return path
+
+
+def read_metadata(path):
+    with safe_open(path, framework='pt') as f:
+        metadata = f.metadata()
+    return {
+        'format_version': int(metadata['format_version']),
+        'model_config': json.loads(metadata['model_config']),
+        'base_weights': json.loads(metadata['base_weights']),
+        # Raises if this code cannot reproduce the model's preprocessing
+        'preprocessing': PreprocessingConfig.from_dict(
+            json.loads(metadata['preprocessing']))
+    }
+
+
+def load_model_weights(path, device='cpu'):
+    # Returns the model in eval mode and the checkpoint metadata. The stored
+    # tensors are memory-mapped and assigned as they are, not copied
+    metadata = read_metadata(path)
+    if metadata['format_version'] > FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format version "
+                         f"{metadata['format_version']} in {path}")
+
+    # Only fetch pretrained weights when the checkpoint refers to them
+    base_weights = metadata['base_weights']
+    model = build_model(metadata['model_config'], pretrained=bool(base_weights))
+
+    state_dict = load_file(path, device='cpu')
+    missing, unexpected = model.load_state_dict(
+        state_dict, strict=False, assign=True)
+    missing = [name for name in missing
+               if not any(name.startswith(p + '.') for p in base_weights)]
+    if missing or unexpected:
+        raise RuntimeError(f"Checkpoint {path} does not match the model: "
+                           f"missing {missing}, unexpected {unexpected}")
+
+    return model.to(device).eval(), metadata
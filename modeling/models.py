@@ -0,0 +1,325 @@
+import torch
+import torch.nn as nn
+from transformers import BertConfig, BertModel
+from torchvision import models as vision_models
+from torch.utils.checkpoint import checkpoint
+from contextlib import nullcontext
+
+
+def is_frozen(module):
+    return not any(param.requires_grad for param in module.parameters())
+
+
+def frozen_context(module):
+    # Frozen submodules run without autograd, so none of their activations
+    # are kept around for a backward pass that never reaches them
+    return torch.no_grad() if is_frozen(module) else nullcontext()
+
+
+def frozen_submodules(module):
+    # Outermost children whose parameters are all frozen
+    for child in module.children():
+        params = list(child.parameters())
+        if params and is_frozen(child):
+            yield child
+        else:
+            yield from frozen_submodules(child)
+
+
+class TextEncoder(nn.Module):
+    # pretrained=False only builds the architecture, for when a checkpoint
+    # provides the BERT weights
+    def __init__(self, pretrained=True):
+        super().__init__()
+        if pretrained:
+            self.bert = BertModel.from_pretrained('bert-base-uncased')
+        else:
+            # BertConfig's defaults are bert-base-uncased, nothing to download
+            self.bert = BertModel(BertConfig())
+
+        for param in self.bert.parameters():
+            param.requires_grad = False
+
+        self.projection = nn.Linear(768, 128)
+
+    def forward(self, input_ids, attention_mask):
+        # Extract BERT embeddings
+        with frozen_context(self.bert):
+            outputs = self.bert(input_ids=input_ids,
+                                attention_mask=attention_mask)
+
+        # Use [CLS] token representation
+        pooler_output = outputs.pooler_output
+
+        return self.projection(pooler_output)
+
+
+class VideoEncoder(nn.Module):
+    def __init__(self, finetune_stages=0, gradient_checkpointing=False,
+                 pretrained=True):
+        super().__init__()
+        self.backbone = vision_models.video.r3d_18(pretrained=pretrained)
+        self.gradient_checkpointing = gradient_checkpointing
+
+        for param in self.backbone.parameters():
+            param.requires_grad = False
+
+        # Unfreeze the last residual stages, layer4 first
+        residual_stages = self.stages()[1:]
+        if not 0 <= finetune_stages <= len(residual_stages):
+            raise ValueError(
+                f"finetune_stages must be between 0 and {len(residual_stages)}")
+        for stage in residual_stages[len(residual_stages) - finetune_stages:]:
+            for param in stage.parameters():
+                param.requires_grad = True
+
+        num_fts = self.backbone.fc.in_features
+        self.backbone.fc = nn.Sequential(
+            nn.Linear(num_fts, 128),
+            nn.ReLU(),
+            nn.Dropout(0.2)
+        )
+
+    def forward(self, x):
+        # [batch_size, frames, channels, height, width]->[batch_size, channels, frames, height, width]
+        x = x.transpose(1, 2)
+
+        # Same as VideoResNet.forward, but frozen stages skip autograd and
+        # fine-tuned stages can recompute their activations during backward
+        for stage in self.stages():
+            if is_frozen(stage):
+                with torch.no_grad():
+                    x = stage(x)
+            elif self.gradient_checkpointing and self.training and torch.is_grad_enabled():
+                x = checkpoint(stage, x, use_reentrant=False)
+            else:
+                x = stage(x)
+
+        x = self.backbone.avgpool(x)
+        x = x.flatten(1)
+        return self.backbone.fc(x)
+
+    def stages(self):
+        return [self.backbone.stem, self.backbone.layer1, self.backbone.layer2,
+                self.backbone.layer3, self.backbone.layer4]
+
+
+class AudioEncoder(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv_layers = nn.Sequential(
+            # Lower level features
+            nn.Conv1d(64, 64, kernel_size=3),
+            nn.BatchNorm1d(64),
+            nn.ReLU(),
+            nn.MaxPool1d(2),
+            # Higher level features
+            nn.Conv1d(64, 128, kernel_size=3),
+            nn.BatchNorm1d(128),
+            nn.ReLU(),
+            nn.AdaptiveAvgPool1d(1)
+        )
+
+        for param in self.conv_layers.parameters():
+            param.requires_grad = False
+
+        self.projection = nn.Sequential(
+            nn.Linear(128, 128),
+            nn.ReLU(),
+            nn.Dropout(0.2)
+        )
+
+    def forward(self, x):
+        x = x.squeeze(1)
+
+        with frozen_context(self.conv_layers):
+            features = self.conv_layers(x)
+        # Features output: [batch_size, 128, 1]
+
+        return self.projection(features.squeeze(-1))
+
+
+class MultimodalFusionModel(nn.Module):
+    # Fusion, classification heads and forward shared by every architecture;
+    # each encoder maps its modality to a 128-d feature vector.
+    # learning_rates are the trainer's per-encoder Adam learning rates
+    learning_rates = {'text_encoder': 8e-6, 'video_encoder': 8e-5,
+                      'audio_encoder': 8e-5}
+    # Submodules initialized from a pretrained download, and its source.
+    # Checkpoints can leave out their frozen weights and refer to these
+    base_weights = {}
+
+    def __init__(self, text_encoder, video_encoder, audio_encoder):
+        super().__init__()
+
+        # Encoders
+        self.text_encoder = text_encoder
+        self.video_encoder = video_encoder
+        self.audio_encoder = audio_encoder
+
+        # Fusion layer
+        self.fusion_layer = nn.Sequential(
+            nn.Linear(128 * 3, 256),
+            nn.BatchNorm1d(256),
+            nn.ReLU(),
+            nn.Dropout(0.3)
+        )
+
+        # Classification heads
+        self.emotion_classifier = nn.Sequential(
+            nn.Linear(256, 64),
+            nn.ReLU(),
+            nn.Dropout(0.2),
+            nn.Linear(64, 7)  # Sadness, anger
+        )
+
+        self.sentiment_classifier = nn.Sequential(
+            nn.Linear(256, 64),
+            nn.ReLU(),
+            nn.Dropout(0.2),
+            nn.Linear(64, 3)  # Negative, positive, neutral
+        )
+
+    def train(self, mode=True):
+        super().train(mode)
+
+        # Frozen BatchNorms keep their pretrained running stats and frozen
+        # dropout stays off
+        if mode:
+            for module in frozen_submodules(self):
+                module.eval()
+        return self
+
+    def forward(self, text_inputs, video_frames, audio_features,
+                return_features=False):
+        text_features = self.text_encoder(
+            text_inputs['input_ids'],
+            text_inputs['attention_mask'],
+        )
+        video_features = self.video_encoder(video_frames)
+        audio_features = self.audio_encoder(audio_features)
+
+        # Concatenate multimodal features
+        combined_features = torch.cat([
+            text_features,
+            video_features,
+            audio_features
+        ], dim=1)  # [batch_size, 128 * 3]
+
+        fused_features = self.fusion_layer(combined_features)
+
+        emotion_output = self.emotion_classifier(fused_features)
+        sentiment_output = self.sentiment_classifier(fused_features)
+
+        outputs = {
+            'emotions': emotion_output,
+            'sentiments': sentiment_output
+        }
+        # Embeddings for similarity search: the fused 256-d features the
+        # heads see, and each encoder's 128-d output
+        if return_features:
+            outputs['features'] = {
+                'fused': fused_features,
+                'text': text_features,
+                'video': video_features,
+                'audio': audio_features
+            }
+        return outputs
+
+
+class MultimodalSentimentModel(MultimodalFusionModel):
+    base_weights = {
+        'text_encoder.bert': 'huggingface:bert-base-uncased',
+        'video_encoder.backbone': 'torchvision:r3d_18/KINETICS400_V1'
+    }
+
+    def __init__(self, video_finetune_stages=0, gradient_checkpointing=False,
+                 pretrained=True):
+        super().__init__(
+            TextEncoder(pretrained=pretrained),
+            VideoEncoder(finetune_stages=video_finetune_stages,
+                         gradient_checkpointing=gradient_checkpointing,
+                         pretrained=pretrained),
+            AudioEncoder())
+
+
+class StudentTextEncoder(nn.Module):
+    # Small transformer over the BERT tokenizer's ids, trained from scratch
+    def __init__(self, vocab_size=30522, max_length=128, hidden_size=256,
+                 num_layers=4, num_heads=4):
+        super().__init__()
+        self.token_embedding = nn.Embedding(vocab_size, hidden_size)
+        self.position_embedding = nn.Embedding(max_length, hidden_size)
+        self.encoder = nn.TransformerEncoder(
+            nn.TransformerEncoderLayer(hidden_size, num_heads,
+                                       dim_feedforward=hidden_size * 4,
+                                       dropout=0.1, batch_first=True),
+            num_layers, enable_nested_tensor=False)
+        self.projection = nn.Linear(hidden_size, 128)
+
+    def forward(self, input_ids, attention_mask):
+        positions = torch.arange(input_ids.size(1), device=input_ids.device)
+        x = self.token_embedding(input_ids) + self.position_embedding(positions)
+        x = self.encoder(x, src_key_padding_mask=attention_mask == 0)
+
+        # Mean over the real tokens
+        mask = attention_mask.unsqueeze(-1).to(x.dtype)
+        pooled = (x * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+        return self.projection(pooled)
+
+
+class StudentVideoEncoder(nn.Module):
+    # 2D MobileNetV3 on every frame_stride-th frame, averaged over time
+    def __init__(self, frame_stride=3, pretrained=True):
+        super().__init__()
+        self.frame_stride = frame_stride
+        backbone = vision_models.mobilenet_v3_small(pretrained=pretrained)
+        self.features = backbone.features
+        self.pool = nn.AdaptiveAvgPool2d(1)
+        self.projection = nn.Sequential(
+            nn.Linear(backbone.classifier[0].in_features, 128),
+            nn.ReLU(),
+            nn.Dropout(0.2)
+        )
+
+    def forward(self, x):
+        # [batch_size, frames, channels, height, width]
+        x = x[:, ::self.frame_stride]
+        batch_size, frames = x.shape[:2]
+
+        x = self.pool(self.features(x.flatten(0, 1))).flatten(1)
+        x = x.view(batch_size, frames, -1).mean(dim=1)
+
+        return self.projection(x)
+
+
+class StudentSentimentModel(MultimodalFusionModel):
+    # Compact model distilled from MultimodalSentimentModel, for bulk jobs.
+    # Its encoders are fully trainable, and the text encoder starts from
+    # scratch, so they learn faster than the frozen teacher's projections
+    learning_rates = {'text_encoder': 5e-4, 'video_encoder': 1e-4,
+                      'audio_encoder': 8e-5}
+
+    def __init__(self, frame_stride=3, pretrained=True):
+        super().__init__(
+            StudentTextEncoder(),
+            StudentVideoEncoder(frame_stride=frame_stride, pretrained=pretrained),
+            AudioEncoder())
+
+
+# model_config.json next to model.pth names the architecture to rebuild,
+# e.g. {"architecture": "student", "frame_stride": 3}
+MODEL_CONFIG_NAME = 'model_config.json'
+ARCHITECTURES = {
+    'multimodal': MultimodalSentimentModel,
+    'student': StudentSentimentModel
+}
+
+
+def build_model(config=None, **kwargs):
+    config = dict(config or {})
+    architecture = config.pop('architecture', 'multimodal')
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture: {architecture}")
+    return ARCHITECTURES[architecture](**config, **kwargs)
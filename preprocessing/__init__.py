@@ -0,0 +1,13 @@
+# Input preprocessing shared by training/ and deployment/. Both must turn a
+# clip into exactly the same tensors, so there is only this one copy. It
+# also holds the per-process thread budgets both sides run with
+from .config import PreprocessingConfig, PREPROCESSING_VERSION
+from .video import load_video_frames
+from .audio import extract_audio_features
+from .text import tokenize
+from .threads import (ThreadBudget, available_cores, thread_budget,
+                      apply_thread_budget, ffmpeg_thread_args)
+
+__all__ = ['PreprocessingConfig', 'PREPROCESSING_VERSION', 'load_video_frames',
+           'extract_audio_features', 'tokenize', 'ThreadBudget', 'available_cores',
+           'thread_budget', 'apply_thread_budget', 'ffmpeg_thread_args']
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import torch
+import torchaudio
+
+from .threads import ffmpeg_thread_args
+
+
+def extract_audio_features(video_path, config):
+    # [1, n_mels, max_audio_frames] mel spectrogram of the video's audio
+    audio_path = video_path.replace('.mp4', '.wav')
+
+    try:
+        subprocess.run([
+            'ffmpeg',
+            *ffmpeg_thread_args(),
+            '-i', video_path,
+            '-vn',
+            '-acodec', 'pcm_s16le',
+            '-ar', str(config.sample_rate),
+            '-ac', '1',
+            audio_path
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        waveform, sample_rate = torchaudio.load(audio_path)
+
+        if sample_rate != config.sample_rate:
+            resampler = torchaudio.transforms.Resample(sample_rate, config.sample_rate)
+            waveform = resampler(waveform)
+
+        mel_spectrogram = torchaudio.transforms.MelSpectrogram(
+            sample_rate=config.sample_rate,
+            n_mels=config.n_mels,
+            n_fft=config.n_fft,
+            hop_length=config.hop_length
+        )
+
+        mel_spec = mel_spectrogram(waveform)
+
+        # Normalize
+        mel_spec = (mel_spec - mel_spec.mean()) / mel_spec.std()
+
+        if mel_spec.size(2) < config.max_audio_frames:
+            padding = config.max_audio_frames - mel_spec.size(2)
+            mel_spec = torch.nn.functional.pad(mel_spec, (0, padding))
+        else:
+            mel_spec = mel_spec[:, :, :config.max_audio_frames]
+
+        return mel_spec
+
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Audio extraction error: {str(e)}")
+    except Exception as e:
+        raise ValueError(f"Audio error: {str(e)}")
+    finally:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
@@ -0,0 +1,42 @@
+from dataclasses import dataclass, asdict, fields
+
+# Bumped whenever the same settings would produce different model inputs,
+# e.g. a change to frame decoding or feature normalization
+PREPROCESSING_VERSION = 1
+
+
+@dataclass(frozen=True)
+class PreprocessingConfig:
+    # Text
+    tokenizer: str = 'bert-base-uncased'
+    max_length: int = 128
+
+    # Video: the first num_frames frames, resized and scaled to [0, 1], in
+    # OpenCV's BGR order
+    num_frames: int = 30
+    frame_size: int = 224
+
+    # Audio: mel spectrogram (not log-scaled), normalized per clip
+    sample_rate: int = 16000
+    n_mels: int = 64
+    n_fft: int = 1024
+    hop_length: int = 512
+    max_audio_frames: int = 300
+
+    version: int = PREPROCESSING_VERSION
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values):
+        # Rejects settings this code cannot reproduce, rather than feeding
+        # the model inputs that differ from the ones it was trained on
+        version = values.get('version', 1)
+        if version != PREPROCESSING_VERSION:
+            raise ValueError(f"Preprocessing version {version} is not supported, "
+                             f"this code implements version {PREPROCESSING_VERSION}")
+        unknown = set(values) - {field.name for field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown preprocessing settings: {sorted(unknown)}")
+        return cls(**values)
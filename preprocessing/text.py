@@ -0,0 +1,11 @@
+def tokenize(tokenizer, text, config):
+    # {'input_ids', 'attention_mask'} of shape [max_length], no batch dimension
+    text_inputs = tokenizer(text,
+                            padding='max_length',
+                            truncation=True,
+                            max_length=config.max_length,
+                            return_tensors='pt')
+    return {
+        'input_ids': text_inputs['input_ids'][0],
+        'attention_mask': text_inputs['attention_mask'][0]
+    }
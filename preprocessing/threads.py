@@ -0,0 +1,93 @@
+import os
+from dataclasses import dataclass
+
+import cv2
+import torch
+
+# Every library sizes its thread pool to the whole machine by default. With
+# several worker processes on one host (model-server workers, torchrun
+# ranks, preprocessing pools) that oversubscribes the cores, and latency
+# spikes as threads preempt each other. The budget splits the cores evenly
+# between the processes instead. INTRA_OP_THREADS, INTER_OP_THREADS,
+# OPENCV_THREADS and FFMPEG_THREADS override the computed values
+#
+# benchmarks/bench_threads.py measures this. On a 1-vCPU host, where the
+# budget only differs from the defaults in ffmpeg's threads, student-model
+# requests on 3 s clips (15 per worker) had median latencies of:
+#   workers  default  budget
+#   1        148 ms   152 ms   (within run-to-run noise)
+#   2        341 ms   316 ms
+#   4        679 ms   649 ms
+# Pools larger than a worker's share of the cores (the overrides set to 4)
+# raised the 4-worker median to 865 ms, against 582 ms with the defaults in
+# the same sweep. Rerun it on the serving instance type before changing
+# the split, which a single core cannot measure
+
+# Set by apply_thread_budget, used by every ffmpeg call
+_ffmpeg_threads = None
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    intra_op: int
+    inter_op: int
+    opencv: int
+    ffmpeg: int
+
+
+def available_cores():
+    # Cores this process may run on, within a container's CPU quota
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def thread_budget(workers=1, cores=None):
+    # Threads per library for one of `workers` processes sharing `cores`
+    cores = cores or available_cores()
+    per_worker = max(1, cores // max(1, workers))
+
+    def override(name, default):
+        return int(os.environ.get(name, default))
+
+    return ThreadBudget(
+        intra_op=override('INTRA_OP_THREADS', per_worker),
+        # Nothing here runs independent ops in parallel, so inter-op
+        # threads would only compete with the intra-op pool
+        inter_op=override('INTER_OP_THREADS', 1),
+        opencv=override('OPENCV_THREADS', per_worker),
+        ffmpeg=override('FFMPEG_THREADS', per_worker))
+
+
+def apply_thread_budget(budget):
+    global _ffmpeg_threads
+    torch.set_num_threads(budget.intra_op)
+    try:
+        torch.set_num_interop_threads(budget.inter_op)
+    except RuntimeError:
+        # Only settable before the first parallel op of the process
+        pass
+    cv2.setNumThreads(budget.opencv)
+    # Every call site tokenizes a single string, where parallelism gains
+    # nothing, and a parallel tokenizer breaks in forked DataLoader and pool
+    # workers
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    _ffmpeg_threads = budget.ffmpeg
+    return budget
+
+
+def ffmpeg_thread_args():
+    # ffmpeg options limiting its decoder and encoder threads, if budgeted
+    if _ffmpeg_threads is None:
+        return []
+    return ['-threads', str(_ffmpeg_threads)]
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import torch
+
+
+def load_video_frames(video_path, config, as_uint8=False):
+    # [num_frames, channels, height, width], float in [0, 1] or uint8
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Video not found: {video_path}")
+
+        # Try and read first frame to validate video
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            raise ValueError(f"Video not found: {video_path}")
+
+        # Reset index to not skip first frame
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        while len(frames) < config.num_frames and cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            frame = cv2.resize(frame, (config.frame_size, config.frame_size))
+            if not as_uint8:
+                frame = frame / 255.0
+            frames.append(frame)
+
+    except Exception as e:
+        raise ValueError(f"Video error: {str(e)}")
+    finally:
+        cap.release()
+
+    if (len(frames) == 0):
+        raise ValueError("No frames could be extracted")
+
+    # Pad or truncate frames
+    if len(frames) < config.num_frames:
+        frames += [np.zeros_like(frames[0])] * (config.num_frames - len(frames))
+    else:
+        frames = frames[:config.num_frames]
+
+    # Before permute: [frames, height, width, channels]
+    # After permute: [frames, channels, height, width]
+    if as_uint8:
+        return torch.from_numpy(np.array(frames)).permute(0, 3, 1, 2)
+    return torch.FloatTensor(np.array(frames)).permute(0, 3, 1, 2)
@@ -1,7 +1,9 @@
+import argparse
 from sagemaker.pytorch import PyTorch
 from sagemaker.debugger import TensorBoardOutputConfig
+from sagemaker.inputs import TrainingInput
 
-def start_training():
+def start_training(instance_count=1, instance_type="ml.g5.xlarge", stream=False):
     tensorboard_config = TensorBoardOutputConfig(
         s3_output_path = "s3://sentiment-analysis-saas-ml/tensorboard",
         container_local_output_path="/opt/ml/output/tensorboard"
@@ -10,24 +12,46 @@ def start_training():
     estimator = PyTorch(
         entry_point="train.py",
         source_dir="training",
+        # Shared with deployment, copied next to train.py
+        dependencies=["preprocessing", "modeling"],
         role="arn:aws:iam::767397834308:role/sentiment-analysis-execution-role",
         framework_version="2.5.1",
         py_version="py311",
-        instance_count=1,
-        instance_type="ml.g5.xlarge",
+        instance_count=instance_count,
+        instance_type=instance_type,
+        # Launches train.py through torchrun on every instance, one process per GPU
+        distribution={"torch_distributed": {"enabled": True}},
         hyperparameters={
             "batch-size": 32,
             "epochs": 25,
+            "checkpoint-dir": "/opt/ml/checkpoints",
         },
+        # Synced with /opt/ml/checkpoints so a restarted job resumes from
+        # the latest checkpoint
+        checkpoint_s3_uri="s3://sentiment-analysis-saas-ml/checkpoints",
         tensorboard_config = tensorboard_config
     )
     
-    # Start training
-    estimator.fit({
+    channels = {
         "training": "s3://sentiment-analysis-saas-ml/dataset/train",
         "validation": "s3://sentiment-analysis-saas-ml/dataset/dev",
         "test": "s3://sentiment-analysis-saas-ml/dataset/test"
-    })
+    }
+    if stream:
+        # Files are fetched from S3 as they are read instead of copied before
+        # train.py starts. Meant for splits packed into shards next to their
+        # clips (training/pack_shards.py), which are read sequentially
+        channels = {name: TrainingInput(uri, input_mode="FastFile")
+                    for name, uri in channels.items()}
+
+    # Start training
+    estimator.fit(channels)
     
 if __name__ == "__main__":
-    start_training()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instance-count", type=int, default=1)
+    parser.add_argument("--instance-type", type=str, default="ml.g5.xlarge")
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    start_training(args.instance_count, args.instance_type, args.stream)
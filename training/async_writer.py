@@ -0,0 +1,43 @@
+import queue
+import threading
+import torch
+from torch.utils.tensorboard import SummaryWriter
+
+
+class AsyncSummaryWriter:
+    # Scalars are queued and written by a background thread. Values can be
+    # device tensors, converting them there keeps the host-device sync off
+    # the training loop.
+    def __init__(self, log_dir):
+        self.writer = SummaryWriter(log_dir=log_dir)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                tag, value, step = item
+                self.writer.add_scalar(tag, float(value), step)
+            except Exception as e:
+                print(f"Failed to write {item[0]}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def add_scalar(self, tag, value, step):
+        # Callers must not modify the tensor in place after handing it over
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+        self.queue.put((tag, value, step))
+
+    def flush(self):
+        self.queue.join()
+        self.writer.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
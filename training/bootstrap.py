@@ -0,0 +1,10 @@
+import importlib.util
+import os
+import sys
+
+# The packages shared by training/ and deployment/ (preprocessing, modeling)
+# are copied next to the entry point of SageMaker jobs (see train_sagemaker.py).
+# In a checkout they are at the repository root instead. Import this module
+# before importing them
+if importlib.util.find_spec('modeling') is None:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,58 @@
+import glob
+import os
+import random
+import numpy as np
+import torch
+
+
+def capture_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class CheckpointManager:
+    def __init__(self, checkpoint_dir, keep_last=3):
+        # The newest checkpoint is the one a resume needs, so it is always kept
+        if keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def checkpoints(self):
+        # Zero-padded step numbers sort in training order
+        return sorted(glob.glob(os.path.join(self.checkpoint_dir, 'checkpoint_*.pt')))
+
+    def latest(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, state, step):
+        path = os.path.join(self.checkpoint_dir, f'checkpoint_{step:09d}.pt')
+
+        # A preemption mid-write must never leave a truncated "latest" file
+        torch.save(state, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+        for old_path in self.checkpoints()[:-self.keep_last]:
+            os.remove(old_path)
+
+        return path
+
+    def load(self, path, map_location=None):
+        # Our own file; RNG states need the full unpickler
+        return torch.load(path, map_location=map_location, weights_only=False)
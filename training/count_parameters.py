@@ -1,43 +1,183 @@
-from models import MultimodalSentimentModel
+import argparse
+import time
+import numpy as np
+import torch
+from torch.utils.flop_counter import FlopCounterMode
+
+import bootstrap  # noqa: F401
+from modeling import MultimodalSentimentModel
+
+COMPONENTS = ['text_encoder', 'video_encoder', 'audio_encoder', 'fusion_layer',
+              'emotion_classifier', 'sentiment_classifier']
+
+
 def count_parameters(model):
-    params_dict = {
-        'text_encoder': 0,
-        'video_encoder': 0,
-        'audio_encoder': 0,
-        'fusion_layer': 0,
-        'emotion_classifier': 0,
-        'sentiment_classifier': 0
-        
-    }
-    
-    total_params = 0
+    # {component: {'total': n, 'trainable': n}}, plus the model-wide totals
+    params_dict = {component: {'total': 0, 'trainable': 0}
+                   for component in COMPONENTS}
+    totals = {'total': 0, 'trainable': 0}
+
     for name, param in model.named_parameters():
-        
+        component = name.split('.')[0]
+        param_count = param.numel()
+
+        params_dict[component]['total'] += param_count
+        totals['total'] += param_count
         if param.requires_grad:
-            param_count = param.numel()
-            total_params += param.numel()
-        
-            if 'text_encoder' in name:
-                params_dict['text_encoder'] += param_count
-            elif 'video_encoder' in name:
-                params_dict['video_encoder'] += param_count
-            elif 'audio_encoder' in name:
-                params_dict['audio_encoder'] += param_count
-            elif 'fusion_layer' in name:
-                params_dict['fusion_layer'] += param_count
-            elif 'emotion_classifier' in name:
-                params_dict['emotion_classifier'] += param_count
-            elif 'sentiment_classifier' in name:
-                params_dict['sentiment_classifier'] += param_count
-
-    return params_dict, total_params
+            params_dict[component]['trainable'] += param_count
+            totals['trainable'] += param_count
+
+    return params_dict, totals
+
+
+def make_inputs(model, batch_size, seq_len, num_frames, frame_size, audio_frames, device):
+    vocab_size = model.text_encoder.bert.config.vocab_size
+    return {
+        'text_encoder': (
+            torch.randint(0, vocab_size, (batch_size, seq_len), device=device),
+            torch.ones(batch_size, seq_len, dtype=torch.long, device=device)),
+        'video_encoder': (
+            torch.rand(batch_size, num_frames, 3, frame_size, frame_size, device=device),),
+        'audio_encoder': (
+            torch.randn(batch_size, 1, 64, audio_frames, device=device),),
+        'fusion': (torch.randn(batch_size, 128 * 3, device=device),),
+        'heads': (torch.randn(batch_size, 256, device=device),)
+    }
+
+
+def component_modules(model):
+    # The report groups both classifiers as "heads"
+    def heads(features):
+        return model.emotion_classifier(features), model.sentiment_classifier(features)
+
+    return {
+        'text_encoder': (model.text_encoder, model.text_encoder),
+        'video_encoder': (model.video_encoder, model.video_encoder),
+        'audio_encoder': (model.audio_encoder, model.audio_encoder),
+        'fusion': (model.fusion_layer, model.fusion_layer),
+        'heads': ([model.emotion_classifier, model.sentiment_classifier], heads)
+    }
+
+
+def count_flops(fn, inputs):
+    # FlopCounterMode sees nothing under inference_mode, no_grad works
+    with torch.no_grad(), FlopCounterMode(display=False) as counter:
+        fn(*inputs)
+    return counter.get_total_flops()
+
+
+def forward_activation_bytes(modules, fn, inputs):
+    # Size of every leaf module output in an inference forward, the same
+    # "forward pass size" torchinfo reports
+    total = 0
+
+    def hook(module, args, output):
+        nonlocal total
+        outputs = output if isinstance(output, (tuple, list)) else [output]
+        for out in outputs:
+            if isinstance(out, torch.Tensor):
+                total += out.numel() * out.element_size()
+
+    handles = [sub.register_forward_hook(hook)
+               for module in modules for sub in module.modules()
+               if not list(sub.children())]
+    try:
+        with torch.inference_mode():
+            fn(*inputs)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return total
+
+
+def saved_for_backward_bytes(modules, fn, inputs):
+    # What a training forward keeps alive for backward, weights excluded.
+    # Frozen modules run without autograd and save nothing
+    weights = {param.untyped_storage().data_ptr()
+               for module in modules for param in module.parameters()}
+    seen = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() not in weights:
+            seen[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn(*inputs)
+    return sum(seen.values())
+
+
+def measure_latency(fn, inputs, device, warmup=2, repeats=10):
+    times = []
+    with torch.inference_mode():
+        for i in range(warmup + repeats):
+            start = time.perf_counter()
+            fn(*inputs)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            if i >= warmup:
+                times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+def profile_components(model, inputs, device, repeats=10):
+    report = {}
+    for name, (modules, fn) in component_modules(model).items():
+        modules = modules if isinstance(modules, list) else [modules]
+        component_inputs = inputs[name]
+
+        model.eval()
+        report[name] = {
+            'flops': count_flops(fn, component_inputs),
+            'forward_activations_mb': forward_activation_bytes(
+                modules, fn, component_inputs) / 1024**2,
+            'latency_ms': measure_latency(fn, component_inputs, device, repeats=repeats)
+        }
+
+        model.train()
+        report[name]['saved_for_backward_mb'] = saved_for_backward_bytes(
+            modules, fn, component_inputs) / 1024**2
+        model.eval()
+    return report
+
 
 if __name__ == '__main__':
-    model = MultimodalSentimentModel()
-    param_dics , total_params = count_parameters(model)
-    
+    parser = argparse.ArgumentParser()
+    # Components are also profiled in train mode, where the fusion layer's
+    # BatchNorm1d needs more than one sample
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--seq-len", type=int, default=128)
+    parser.add_argument("--num-frames", type=int, default=30)
+    parser.add_argument("--frame-size", type=int, default=224)
+    parser.add_argument("--audio-frames", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--device", type=str,
+                        default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+    if args.batch_size < 2:
+        parser.error("--batch-size must be at least 2 to profile train mode")
+
+    device = torch.device(args.device)
+    model = MultimodalSentimentModel().to(device)
+    param_dics, totals = count_parameters(model)
+
     print("Parameter count by component:")
-    for component, count in param_dics.items():
-        print(f"{component:20s}: {count:,} parameters")
-        
-    print("\nTotal trainable paramters", f"{total_params:,}")
\ No newline at end of file
+    for component, counts in param_dics.items():
+        print(f"{component:20s}: {counts['total']:>12,} total, "
+              f"{counts['trainable']:>10,} trainable")
+
+    print(f"\nTotal parameters: {totals['total']:,}")
+    print(f"Total trainable parameters: {totals['trainable']:,}")
+
+    inputs = make_inputs(model, args.batch_size, args.seq_len, args.num_frames,
+                         args.frame_size, args.audio_frames, device)
+    report = profile_components(model, inputs, device, repeats=args.repeats)
+
+    print(f"\nCost by component (batch size {args.batch_size}, {device}):")
+    print(f"{'component':20s} {'GFLOPs':>10s} {'activations MB':>15s} "
+          f"{'saved for bwd MB':>17s} {'latency ms':>11s}")
+    for name, stats in report.items():
+        print(f"{name:20s} {stats['flops'] / 1e9:10.2f} "
+              f"{stats['forward_activations_mb']:15.1f} "
+              f"{stats['saved_for_backward_mb']:17.1f} {stats['latency_ms']:11.2f}")
@@ -0,0 +1,85 @@
+import os
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def get_local_rank():
+    return int(os.environ.get('LOCAL_RANK', 0))
+
+
+def get_local_world_size():
+    # Processes on this node, as set by torchrun
+    return int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def setup_distributed(backend=None):
+    # torchrun sets WORLD_SIZE/RANK/LOCAL_RANK; a plain `python train.py`
+    # run stays single process
+    if int(os.environ.get('WORLD_SIZE', 1)) <= 1:
+        return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    if torch.cuda.is_available():
+        torch.cuda.set_device(get_local_rank())
+        device = torch.device('cuda', get_local_rank())
+    else:
+        device = torch.device('cpu')
+
+    if backend is None:
+        backend = 'nccl' if device.type == 'cuda' else 'gloo'
+
+    dist.init_process_group(backend=backend)
+    return device
+
+
+def cleanup_distributed():
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def all_reduce_sum(tensor):
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def all_gather_object(obj):
+    if not is_distributed():
+        return [obj]
+    gathered = [None] * get_world_size()
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def wrap_model(model, device):
+    if not is_distributed():
+        return model
+    device_ids = [device.index] if device.type == 'cuda' else None
+    return DistributedDataParallel(model, device_ids=device_ids)
+
+
+def unwrap_model(model):
+    if isinstance(model, DistributedDataParallel):
+        return model.module
+    return model
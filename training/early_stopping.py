@@ -0,0 +1,42 @@
+class EarlyStopping:
+    # metric is 'loss' (validation total loss) or any key returned by
+    # MultimodalTrainer.evaluate, e.g. 'emotion_f1'
+    def __init__(self, metric='loss', patience=3, min_delta=0.0, mode=None):
+        self.metric = metric
+        self.patience = patience
+        self.min_delta = min_delta
+        self.mode = mode or ('min' if metric == 'loss' else 'max')
+        self.best = None
+        self.bad_evaluations = 0
+
+    @property
+    def should_stop(self):
+        return self.bad_evaluations >= self.patience
+
+    def get_value(self, val_loss, val_metrics):
+        if self.metric == 'loss':
+            return val_loss['total']
+        return val_metrics[self.metric]
+
+    def step(self, value):
+        if self.best is None:
+            improved = True
+        elif self.mode == 'min':
+            improved = value < self.best - self.min_delta
+        else:
+            improved = value > self.best + self.min_delta
+
+        if improved:
+            self.best = value
+            self.bad_evaluations = 0
+        else:
+            self.bad_evaluations += 1
+
+        return self.should_stop
+
+    def state_dict(self):
+        return {'best': self.best, 'bad_evaluations': self.bad_evaluations}
+
+    def load_state_dict(self, state):
+        self.best = state['best']
+        self.bad_evaluations = state['bad_evaluations']
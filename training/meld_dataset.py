@@ -1,23 +1,145 @@
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, IterableDataset, DataLoader, Sampler, Subset
+from torch.utils.data.distributed import DistributedSampler
+import torch.distributed as dist
 import pandas as pd
 import torch.utils.data.dataloader
 from transformers import AutoTokenizer
 import os
 import cv2
-import numpy as np
 import torch
 import subprocess
 import torchaudio
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+import json
+import bisect
+import itertools
+import tempfile
+import io
+import copy
+import random
+import tarfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+# Tokenizers used in forked DataLoader workers must not be parallel
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import bootstrap  # noqa: F401
+from preprocessing import (PreprocessingConfig, load_video_frames,
+                           extract_audio_features, tokenize, ffmpeg_thread_args)
+
+
+def video_filename(row):
+    return f"dia{row['Dialogue_ID']}_utt{row['Utterance_ID']}.mp4"
+
+
+def manifest_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '_manifest.json'
+
+
+def validate_video(video_path, sample_rate=16000):
+    # Returns None for a usable clip, otherwise the reason it is unusable.
+    # Audio is extracted at the sample rate training will use
+    if not os.path.exists(video_path):
+        return "missing"
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return "unreadable video"
+
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            return "no decodable frames"
+    finally:
+        cap.release()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio_path = os.path.join(temp_dir, 'audio.wav')
+        try:
+            subprocess.run([
+                'ffmpeg',
+                *ffmpeg_thread_args(),
+                '-i', video_path,
+                '-vn',
+                '-acodec', 'pcm_s16le',
+                '-ar', str(sample_rate),
+                '-ac', '1',
+                audio_path
+            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            waveform, _ = torchaudio.load(audio_path)
+        except Exception:
+            return "no extractable audio"
+
+        if waveform.numel() == 0:
+            return "empty audio"
+
+        # A silent track has zero std and would normalize to NaN
+        if waveform.abs().max() == 0:
+            return "silent audio"
+
+    return None
+
+
+def scan_dataset(csv_path, video_dir, num_workers=None, preprocessing=None):
+    preprocessing = preprocessing or PreprocessingConfig()
+    data = pd.read_csv(csv_path)
+    filenames = [video_filename(row) for _, row in data.iterrows()]
+    paths = [os.path.join(video_dir, filename) for filename in filenames]
+    sample_rates = [preprocessing.sample_rate] * len(paths)
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        reasons = list(executor.map(validate_video, paths, sample_rates, chunksize=16))
+
+    return {
+        'csv': os.path.basename(csv_path),
+        'total': len(filenames),
+        'sample_rate': preprocessing.sample_rate,
+        'valid': [filename for filename, reason in zip(filenames, reasons)
+                  if reason is None],
+        'invalid': {filename: reason for filename, reason in zip(filenames, reasons)
+                    if reason is not None}
+    }
+
+
+def write_manifest(manifest, manifest_path):
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, manifest_path)
 
 
 class MELDDataset(Dataset):
-    def __init__(self, csv_path, video_dir):
+    def __init__(self, csv_path, video_dir, manifest_path=None,
+                 preprocessing=None):
         self.data = pd.read_csv(csv_path)
 
         self.video_dir = video_dir
-
-        self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
+        self.preprocessing = preprocessing or PreprocessingConfig()
+
+        # Keep only rows a previous scan found usable, so broken clips are
+        # never decoded and batches keep a constant size
+        if manifest_path is None and os.path.exists(manifest_path_for(csv_path)):
+            manifest_path = manifest_path_for(csv_path)
+
+        if manifest_path is not None:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            # Clips were checked by extracting audio at this sample rate
+            scanned_rate = manifest.get('sample_rate', 16000)
+            if scanned_rate != self.preprocessing.sample_rate:
+                raise ValueError(
+                    f"Manifest {manifest_path} was scanned at {scanned_rate} Hz but "
+                    f"audio is extracted at {self.preprocessing.sample_rate} Hz, "
+                    f"rerun scan_dataset.py")
+            valid = set(manifest['valid'])
+
+            total = len(self.data)
+            mask = self.data.apply(
+                lambda row: video_filename(row) in valid, axis=1)
+            self.data = self.data[mask].reset_index(drop=True)
+            print(f"Manifest {manifest_path}: kept {len(self.data)}/{total} samples")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.preprocessing.tokenizer)
 
         self.emotion_map = {
             'anger': 0, 'disgust': 1, 'fear': 2, 'joy': 3, 'neutral': 4, 'sadness': 5, 'surprise': 6
@@ -27,141 +149,376 @@ class MELDDataset(Dataset):
             'negative': 0, 'neutral': 1, 'positive': 2
         }
 
-    def _load_video_frames(self, video_path):
-        cap = cv2.VideoCapture(video_path)
-        frames = []
-
-        try:
-            if not cap.isOpened():
-                raise ValueError(f"Video not found: {video_path}")
-
-            # Try and read first frame to validate video
-            ret, frame = cap.read()
-            if not ret or frame is None:
-                raise ValueError(f"Video not found: {video_path}")
-
-            # Reset index to not skip first frame
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    def __len__(self):
+        return len(self.data)
 
-            while len(frames) < 30 and cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
+    def get_labels(self):
+        emotion_labels = self.data['Emotion'].str.lower().map(self.emotion_map)
+        sentiment_labels = self.data['Sentiment'].str.lower().map(
+            self.sentiment_map)
+        return (torch.tensor(emotion_labels.values),
+                torch.tensor(sentiment_labels.values))
 
-                frame = cv2.resize(frame, (224, 224))
-                frame = frame / 255.0
-                frames.append(frame)
+    def __getitem__(self, idx):
+        if isinstance(idx, torch.Tensor):
+            idx = idx.item()
+        row = self.data.iloc[idx]
+        path = os.path.join(self.video_dir, video_filename(row))
 
+        try:
+            return self.load_sample(idx)
         except Exception as e:
-            raise ValueError(f"Video error: {str(e)}")
-        finally:
-            cap.release()
-
-        if (len(frames) == 0):
-            raise ValueError("No frames could be extracted")
-
-        # Pad or truncate frames
-        if len(frames) < 30:
-            frames += [np.zeros_like(frames[0])] * (30 - len(frames))
-        else:
-            frames = frames[:30]
-
-        # Before permute: [frames, height, width, channels]
-        # After permute: [frames, channels, height, width]
-        return torch.FloatTensor(np.array(frames)).permute(0, 3, 1, 2)
-
-    def _extract_audio_features(self, video_path):
-        audio_path = video_path.replace('.mp4', '.wav')
+            print(f"Error processing {path}: {str(e)}")
+            return None
 
-        try:
-            subprocess.run([
-                'ffmpeg',
-                '-i', video_path,
-                '-vn',
-                '-acodec', 'pcm_s16le',
-                '-ar', '16000',
-                '-ac', '1',
-                audio_path
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    def load_sample(self, idx, frames_as_uint8=False):
+        row = self.data.iloc[idx]
+        path = os.path.join(self.video_dir, video_filename(row))
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No video found for filename: {path}")
+
+        text_inputs = tokenize(self.tokenizer, row['Utterance'], self.preprocessing)
+        video_frames = load_video_frames(path, self.preprocessing,
+                                         as_uint8=frames_as_uint8)
+        audio_features = extract_audio_features(path, self.preprocessing)
+
+        # Map sentiment and emotion labels
+        emotion_label = self.emotion_map[row['Emotion'].lower()]
+        sentiment_label = self.sentiment_map[row['Sentiment'].lower()]
+
+        return {
+            'text_inputs': text_inputs,
+            'video_frames': video_frames,
+            'audio_features': audio_features,
+            'emotion_label': torch.tensor(emotion_label),
+            'sentiment_label': torch.tensor(sentiment_label)
+        }
 
-            waveform, sample_rate = torchaudio.load(audio_path)
 
-            if sample_rate != 16000:
-                resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-                waveform = resampler(waveform)
+def preprocessed_dir_for(video_dir):
+    return os.path.normpath(video_dir) + '_preprocessed'
 
-            mel_spectrogram = torchaudio.transforms.MelSpectrogram(
-                sample_rate=16000,
-                n_mels=64,
-                n_fft=1024,
-                hop_length=512
-            )
 
-            mel_spec = mel_spectrogram(waveform)
+class PreprocessedMELDDataset(Dataset):
+    # Reads the chunk files written by preprocess_dataset.py. Chunks are
+    # memory-mapped, so a sample only pages in its own frames.
+    def __init__(self, preprocessed_dir):
+        self.preprocessed_dir = preprocessed_dir
 
-            # Normalize
-            mel_spec = (mel_spec - mel_spec.mean()) / mel_spec.std()
+        with open(os.path.join(preprocessed_dir, 'index.json')) as f:
+            self.index = json.load(f)
+        # Indexes written before this was recorded used the defaults
+        self.preprocessing = PreprocessingConfig.from_dict(
+            self.index.get('preprocessing', {}))
 
-            if mel_spec.size(2) < 300:
-                padding = 300 - mel_spec.size(2)
-                mel_spec = torch.nn.functional.pad(mel_spec, (0, padding))
-            else:
-                mel_spec = mel_spec[:, :, :300]
+        self.chunk_files = [chunk['file'] for chunk in self.index['chunks']]
+        self.offsets = [0]
+        for chunk in self.index['chunks']:
+            self.offsets.append(self.offsets[-1] + chunk['size'])
 
-            return mel_spec
+        self.chunks = {}
 
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Audio extraction error: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"Audio error: {str(e)}")
-        finally:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
+    def _get_chunk(self, chunk_idx):
+        if chunk_idx not in self.chunks:
+            self.chunks[chunk_idx] = torch.load(
+                os.path.join(self.preprocessed_dir,
+                             self.chunk_files[chunk_idx]),
+                mmap=True, weights_only=True)
+        return self.chunks[chunk_idx]
 
     def __len__(self):
-        return len(self.data)
+        return self.offsets[-1]
+
+    def get_labels(self):
+        emotion_labels = []
+        sentiment_labels = []
+        for chunk_idx in range(len(self.chunk_files)):
+            chunk = self._get_chunk(chunk_idx)
+            emotion_labels.append(chunk['emotion_label'])
+            sentiment_labels.append(chunk['sentiment_label'])
+        return torch.cat(emotion_labels), torch.cat(sentiment_labels)
 
     def __getitem__(self, idx):
         if isinstance(idx, torch.Tensor):
             idx = idx.item()
-        row = self.data.iloc[idx]
-
-        try:
-            video_filename = f"""dia{row['Dialogue_ID']}_utt{
-                row['Utterance_ID']}.mp4"""
 
-            path = os.path.join(self.video_dir, video_filename)
-            video_path_exists = os.path.exists(path)
+        chunk_idx = bisect.bisect_right(self.offsets, idx) - 1
+        chunk = self._get_chunk(chunk_idx)
+        i = idx - self.offsets[chunk_idx]
+
+        return {
+            'text_inputs': {
+                'input_ids': chunk['input_ids'][i],
+                'attention_mask': chunk['attention_mask'][i]
+            },
+            'video_frames': chunk['video_frames'][i].float() / 255.0,
+            'audio_features': chunk['audio_features'][i],
+            'emotion_label': chunk['emotion_label'][i],
+            'sentiment_label': chunk['sentiment_label'][i]
+        }
 
-            if video_path_exists == False:
-                raise FileNotFoundError(f"No video found for filename: {path}")
 
-            text_inputs = self.tokenizer(row['Utterance'],
-                                         padding='max_length',
-                                         truncation=True,
-                                         max_length=128,
-                                         return_tensors='pt')
+def shards_dir_for(video_dir):
+    return os.path.normpath(video_dir) + '_shards'
+
+
+# Shards are read front to back, large buffers keep object-store and pipe
+# reads efficient
+STREAM_BUFFER_SIZE = 1 << 20
+
+
+@contextlib.contextmanager
+def open_shard_stream(location, name):
+    # location is a directory, or "pipe:" and a command writing the named
+    # file to stdout, e.g. "pipe:aws s3 cp s3://bucket/train_splits_shards/{} -"
+    if not location.startswith('pipe:'):
+        with open(os.path.join(location, name), 'rb',
+                  buffering=STREAM_BUFFER_SIZE) as f:
+            yield f
+        return
+
+    command = location[len('pipe:'):].format(name)
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                               bufsize=STREAM_BUFFER_SIZE)
+    try:
+        yield process.stdout
+    except BaseException:
+        # Abandoned part way, e.g. a finished epoch quota
+        process.kill()
+        process.wait()
+        raise
+    process.stdout.close()
+    if process.wait() != 0:
+        raise IOError(f"'{command}' exited with status {process.returncode}")
+
+
+def read_shard(location, name):
+    # Yields (key, {extension: bytes}). A sample is the consecutive members
+    # sharing a key, e.g. dia1_utt2.json and dia1_utt2.mp4
+    with open_shard_stream(location, name) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            key, sample = None, {}
+            for member in tar:
+                if not member.isfile():
+                    continue
+                member_key, extension = member.name.split('.', 1)
+                if member_key != key:
+                    if sample:
+                        yield key, sample
+                    key, sample = member_key, {}
+                sample[extension] = tar.extractfile(member).read()
+            if sample:
+                yield key, sample
+
+
+def shuffle_buffer(samples, size, rng):
+    # Each sample leaves the buffer at a random later point, mixing samples
+    # across shards without holding more than size of them
+    buffer = []
+    for sample in samples:
+        if len(buffer) < size:
+            buffer.append(sample)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def share(total, part, parts):
+    # part's share of total split as evenly as possible between parts
+    return total // parts + (1 if part < total % parts else 0)
+
+
+class ShardedMELDDataset(IterableDataset):
+    # Streams the tar shards written by pack_shards.py from a directory or a
+    # pipe: command, so a split never has to be copied to local disk before
+    # training starts. Shards are divided between ranks, then between
+    # DataLoader workers, and read sequentially.
+    def __init__(self, location, shuffle=False, shuffle_buffer_size=256,
+                 seed=0, num_replicas=1, rank=0, batch_size=1,
+                 preprocessing=None):
+        self.location = location
+        # Parsed after the stream closes, so a failed pipe command reports
+        # its own error
+        with open_shard_stream(location, 'index.json') as f:
+            index = f.read()
+        self.index = json.loads(index)
+        self.shards = self.index['shards']
+        self.format = self.index['format']
+
+        # Decoded shards are fixed to the settings they were packed with,
+        # clips are decoded here with the given ones
+        if 'preprocessing' in self.index:
+            self.preprocessing = PreprocessingConfig.from_dict(
+                self.index['preprocessing'])
+        else:
+            self.preprocessing = preprocessing or PreprocessingConfig()
+        self.tokenizer = None
+        if self.format == 'raw':
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                self.preprocessing.tokenizer)
+
+        self.shuffle = shuffle
+        # Training batches are never partial: drop_last, and samples that
+        # fail to decode are replaced by the ones after them
+        self.batch_size = batch_size
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.start_index = 0
+        self.max_samples = None
+
+        # Training ranks have to run the same number of steps, so each takes
+        # an equal number of whole batches and rereads its shards if they
+        # fall short. Evaluation reads every sample exactly once instead.
+        self.total = sum(shard['size'] for shard in self.shards)
+        self.batches_per_rank = self.total // num_replicas // batch_size
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def set_start_index(self, start_index):
+        # Samples of this epoch a resumed run already trained on, always
+        # whole batches
+        self.start_index = start_index
+
+    def limit(self, num_samples):
+        # The same leading samples on every pass, for a cheap evaluation
+        limited = copy.copy(self)
+        limited.max_samples = share(num_samples, self.rank, self.num_replicas)
+        return limited
 
-            video_frames = self._load_video_frames(path)
-            audio_features = self._extract_audio_features(path)
+    def __len__(self):
+        if self.shuffle:
+            start_batch = self.start_index // self.batch_size
+            return (self.batches_per_rank - start_batch) * self.batch_size
+        size = sum(shard['size']
+                   for shard in self.shards[self.rank::self.num_replicas])
+        return size if self.max_samples is None else min(size, self.max_samples)
+
+    def get_labels(self):
+        emotion_labels = [label for shard in self.shards
+                          for label in shard['emotion_labels']]
+        sentiment_labels = [label for shard in self.shards
+                            for label in shard['sentiment_labels']]
+        return torch.tensor(emotion_labels), torch.tensor(sentiment_labels)
+
+    def __iter__(self):
+        worker = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+
+        if not self.shuffle:
+            rank_shards = self.shards[self.rank::self.num_replicas]
+            samples = itertools.chain.from_iterable(
+                read_shard(self.location, shard['file'])
+                for shard in rank_shards[worker_id::num_workers])
+            if self.max_samples is not None:
+                samples = itertools.islice(
+                    samples, share(self.max_samples, worker_id, num_workers))
+            return (self._decode(key, sample) for key, sample in samples)
+
+        # Every rank shuffles the shard order the same way for the epoch,
+        # then takes its own slice. With more consumers than shards some
+        # shards are read twice.
+        shards = list(self.shards)
+        random.Random(self.seed + self.epoch).shuffle(shards)
+        rank_shards = (shards[self.rank::self.num_replicas]
+                       or [shards[self.rank % len(shards)]])
+        worker_shards = (rank_shards[worker_id::num_workers]
+                         or [rank_shards[worker_id % len(rank_shards)]])
+
+        # Shuffled one pass over the shards at a time, so a sample is only
+        # repeated once every other one has been seen
+        rng = random.Random(f"{self.seed}-{self.epoch}-{self.rank}-{worker_id}")
+        samples = itertools.chain.from_iterable(
+            shuffle_buffer(
+                itertools.chain.from_iterable(
+                    read_shard(self.location, shard['file'])
+                    for shard in worker_shards),
+                self.shuffle_buffer_size, rng)
+            for _ in itertools.count())
+        # The DataLoader takes one batch from each worker in turn, so this
+        # worker makes batches worker_id, worker_id + num_workers, ... of the
+        # rank's epoch. A resumed run skips the ones it handed out before.
+        # Skipped samples are read but never decoded, so any that failed to
+        # decode before count towards the skip
+        start_batch = self.start_index // self.batch_size
+        start = share(start_batch, worker_id, num_workers) * self.batch_size
+        stop = share(self.batches_per_rank, worker_id, num_workers) * self.batch_size
+        samples = itertools.islice(samples, start, None)
+        max_failures = sum(shard['size'] for shard in worker_shards)
+        return itertools.islice(
+            self._decode_valid(samples, max_failures), stop - start)
+
+    def _decode_valid(self, samples, max_failures):
+        # Decoded samples, without the ones that fail. More failures in a
+        # row than a whole pass over the worker's shards means none decode
+        failures = 0
+        for key, sample in samples:
+            decoded = self._decode(key, sample)
+            if decoded is not None:
+                failures = 0
+                yield decoded
+                continue
+            failures += 1
+            if failures > max_failures:
+                raise RuntimeError(f"No sample in the shards of {self.location} "
+                                   f"could be decoded")
+
+    def _decode(self, key, sample):
+        try:
+            if 'pth' in sample:
+                decoded = torch.load(io.BytesIO(sample['pth']), weights_only=True)
+                decoded['video_frames'] = decoded['video_frames'].float() / 255.0
+                return decoded
+            return self._decode_clip(key, sample['mp4'], json.loads(sample['json']))
+        except Exception as e:
+            print(f"Error processing {key}: {str(e)}")
+            return None
 
-            # Map sentiment and emotion labels
-            emotion_label = self.emotion_map[row['Emotion'].lower()]
-            sentiment_label = self.sentiment_map[row['Sentiment'].lower()]
+    def _decode_clip(self, key, clip, metadata):
+        # OpenCV and ffmpeg read from a path
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, f'{key}.mp4')
+            with open(path, 'wb') as f:
+                f.write(clip)
 
             return {
-                'text_inputs': {
-                    'input_ids': text_inputs['input_ids'].squeeze(),
-                    'attention_mask': text_inputs['attention_mask'].squeeze()
-                },
-                'video_frames': video_frames,
-                'audio_features': audio_features,
-                'emotion_label': torch.tensor(emotion_label),
-                'sentiment_label': torch.tensor(sentiment_label)
+                'text_inputs': tokenize(self.tokenizer, metadata['utterance'],
+                                        self.preprocessing),
+                'video_frames': load_video_frames(path, self.preprocessing),
+                'audio_features': extract_audio_features(path, self.preprocessing),
+                'emotion_label': torch.tensor(metadata['emotion_label']),
+                'sentiment_label': torch.tensor(metadata['sentiment_label'])
             }
-        except Exception as e:
-            print(f"Error processing {path}: {str(e)}")
-            return None
+
+
+def load_split(csv_path, video_dir, shards=None, train=False,
+               distributed=False, shuffle_buffer_size=256, batch_size=1):
+    # shards streams the split from that location. Otherwise preprocessed
+    # chunks are preferred, then shards packed next to the clips
+    preprocessed_dir = preprocessed_dir_for(video_dir)
+    if shards is None and os.path.exists(os.path.join(preprocessed_dir, 'index.json')):
+        print(f"Using preprocessed samples from {preprocessed_dir}")
+        return PreprocessedMELDDataset(preprocessed_dir)
+
+    if shards is None and os.path.exists(
+            os.path.join(shards_dir_for(video_dir), 'index.json')):
+        shards = shards_dir_for(video_dir)
+    if shards is not None:
+        print(f"Streaming shards from {shards}")
+        replicas = ({'num_replicas': dist.get_world_size(), 'rank': dist.get_rank()}
+                    if distributed else {})
+        return ShardedMELDDataset(shards, shuffle=train,
+                                  shuffle_buffer_size=shuffle_buffer_size,
+                                  batch_size=batch_size, **replicas)
+
+    return MELDDataset(csv_path, video_dir)
 
 
 def collate_fn(batch):
@@ -170,29 +527,115 @@ def collate_fn(batch):
     return torch.utils.data.dataloader.default_collate(batch)
 
 
+class ResumableSampler(DistributedSampler):
+    # DistributedSampler already derives its order from (seed, epoch), so a
+    # resumed run can replay an epoch's order and skip what was consumed
+    def __init__(self, dataset, num_replicas=None, rank=None, shuffle=True, seed=0):
+        super().__init__(dataset, num_replicas=num_replicas, rank=rank,
+                         shuffle=shuffle, seed=seed)
+        self.start_index = 0
+
+    def set_start_index(self, start_index):
+        self.start_index = start_index
+
+    def __iter__(self):
+        return itertools.islice(super().__iter__(), self.start_index, None)
+
+    def __len__(self):
+        return super().__len__() - self.start_index
+
+
+class DistributedEvalSampler(Sampler):
+    # Unlike DistributedSampler this does not pad the last shard with
+    # duplicates, so every sample is scored exactly once across ranks
+    def __init__(self, dataset, num_replicas=None, rank=None):
+        self.dataset = dataset
+        self.num_replicas = num_replicas if num_replicas is not None else dist.get_world_size()
+        self.rank = rank if rank is not None else dist.get_rank()
+
+    def __iter__(self):
+        return iter(range(self.rank, len(self.dataset), self.num_replicas))
+
+    def __len__(self):
+        return len(range(self.rank, len(self.dataset), self.num_replicas))
+
+
 def prepare_dataloaders(train_csv, train_video_dir,
                         dev_csv, dev_video_dir,
-                        test_csv, test_video_dir, batch_size=32):
-    train_dataset = MELDDataset(train_csv, train_video_dir)
-    dev_dataset = MELDDataset(dev_csv, dev_video_dir)
-    test_dataset = MELDDataset(test_csv, test_video_dir)
-
+                        test_csv, test_video_dir, batch_size=32,
+                        distributed=False, shards=None, shuffle_buffer_size=256):
+    # shards optionally maps 'train', 'dev' and 'test' to shard locations
+    shards = shards or {}
+    train_dataset = load_split(train_csv, train_video_dir, shards.get('train'),
+                               train=True, distributed=distributed,
+                               shuffle_buffer_size=shuffle_buffer_size,
+                               batch_size=batch_size)
+    dev_dataset = load_split(dev_csv, dev_video_dir, shards.get('dev'),
+                             distributed=distributed)
+    test_dataset = load_split(test_csv, test_video_dir, shards.get('test'),
+                              distributed=distributed)
+    for dataset in [dev_dataset, test_dataset]:
+        if dataset.preprocessing != train_dataset.preprocessing:
+            raise ValueError("Splits were preprocessed with different settings")
+
+    # Streamed splits divide their shards between ranks themselves
+    train_sampler = dev_sampler = test_sampler = None
+    if not isinstance(train_dataset, IterableDataset):
+        if distributed:
+            train_sampler = ResumableSampler(train_dataset, shuffle=True)
+        else:
+            train_sampler = ResumableSampler(
+                train_dataset, num_replicas=1, rank=0, shuffle=True)
+    if distributed:
+        if not isinstance(dev_dataset, IterableDataset):
+            dev_sampler = DistributedEvalSampler(dev_dataset)
+        if not isinstance(test_dataset, IterableDataset):
+            test_sampler = DistributedEvalSampler(test_dataset)
+
+    # Per-rank shards rarely divide evenly; a trailing batch of one sample
+    # would break the BatchNorm in the fusion layer
     train_loader = DataLoader(train_dataset,
                               batch_size=batch_size,
-                              shuffle=True,
-                              collate_fn=collate_fn)
+                              sampler=train_sampler,
+                              collate_fn=collate_fn,
+                              drop_last=True)
 
     dev_loader = DataLoader(dev_dataset,
                             batch_size=batch_size,
+                            sampler=dev_sampler,
                             collate_fn=collate_fn)
 
     test_loader = DataLoader(test_dataset,
                              batch_size=batch_size,
+                             sampler=test_sampler,
                              collate_fn=collate_fn)
 
     return train_loader, dev_loader, test_loader
 
 
+def subsample_loader(data_loader, num_samples, seed=0):
+    # A fixed random subset, so intermediate evaluations stay comparable
+    if isinstance(data_loader.dataset, ShardedMELDDataset):
+        # Streamed splits cannot be indexed, they always yield the same
+        # leading samples instead
+        return DataLoader(data_loader.dataset.limit(num_samples),
+                          batch_size=data_loader.batch_size,
+                          collate_fn=data_loader.collate_fn)
+
+    generator = torch.Generator().manual_seed(seed)
+    indices = torch.randperm(len(data_loader.dataset), generator=generator)
+    subset = Subset(data_loader.dataset, sorted(indices[:num_samples].tolist()))
+
+    sampler = None
+    if isinstance(data_loader.sampler, DistributedEvalSampler):
+        sampler = DistributedEvalSampler(subset)
+
+    return DataLoader(subset,
+                      batch_size=data_loader.batch_size,
+                      sampler=sampler,
+                      collate_fn=data_loader.collate_fn)
+
+
 if __name__ == "__main__":
     train_loader, dev_loader, test_loader = prepare_dataloaders(
         '../dataset/train/train_sent_emo.csv', '../dataset/train/train_splits',
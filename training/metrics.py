@@ -0,0 +1,69 @@
+import torch
+
+from distributed import all_reduce_sum
+
+
+class ConfusionMatrix:
+    # Rows are true labels, columns are predictions. Updates stay on the
+    # device, nothing is read back until compute()
+    def __init__(self, num_classes, device=None):
+        self.num_classes = num_classes
+        self.matrix = torch.zeros(num_classes, num_classes,
+                                  dtype=torch.long, device=device)
+
+    def update(self, preds, labels):
+        indices = labels.flatten() * self.num_classes + preds.flatten()
+        counts = torch.bincount(indices, minlength=self.num_classes ** 2)
+        self.matrix += counts.view(self.num_classes, self.num_classes)
+
+    def merge(self, other):
+        self.matrix += other.matrix
+        return self
+
+    def all_reduce(self):
+        # Sum the counts of every rank, after this each rank holds the
+        # full-dataset matrix
+        all_reduce_sum(self.matrix)
+        return self
+
+    def compute(self):
+        matrix = self.matrix.double()
+        true_positives = matrix.diagonal()
+        support = matrix.sum(dim=1)
+        predicted = matrix.sum(dim=0)
+        total = support.sum()
+
+        # Classes that are never predicted (or never present) score 0, the
+        # same as sklearn's zero_division default
+        precision = torch.where(predicted > 0,
+                                true_positives / predicted.clamp(min=1), 0.0)
+        recall = torch.where(support > 0,
+                             true_positives / support.clamp(min=1), 0.0)
+        f1_denominator = precision + recall
+        f1 = torch.where(f1_denominator > 0,
+                         2 * precision * recall / f1_denominator.clamp(min=1e-12), 0.0)
+
+        weights = support / total.clamp(min=1)
+        summary = torch.stack([
+            true_positives.sum() / total.clamp(min=1),
+            (precision * weights).sum(),
+            (recall * weights).sum(),
+            (f1 * weights).sum()
+        ])
+
+        # One device-to-host transfer for everything
+        values = torch.cat([summary, precision, recall, f1, support]).tolist()
+        n = self.num_classes
+
+        return {
+            'accuracy': values[0],
+            'precision': values[1],
+            'recall': values[2],
+            'f1': values[3],
+            'per_class': {
+                'precision': values[4:4 + n],
+                'recall': values[4 + n:4 + 2 * n],
+                'f1': values[4 + 2 * n:4 + 3 * n],
+                'support': [int(s) for s in values[4 + 3 * n:]]
+            }
+        }
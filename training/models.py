@@ -1,182 +1,75 @@
 import torch
 import torch.nn as nn
-from transformers import BertModel
-from torchvision import models as vision_models
-from sklearn.metrics import precision_score, accuracy_score
-from torch.utils.tensorboard import SummaryWriter
+import torch.nn.functional as F
+from torch.utils.data import IterableDataset
 from datetime import datetime
+from contextlib import nullcontext
 import os
 
+import bootstrap  # noqa: F401
+# The model classes are shared with deployment/
+from modeling import (MultimodalFusionModel, MultimodalSentimentModel,  # noqa: F401
+                      StudentSentimentModel, build_model, MODEL_CONFIG_NAME)
 from meld_dataset import MELDDataset
+from async_writer import AsyncSummaryWriter
+from metrics import ConfusionMatrix
+from checkpointing import capture_rng_state, restore_rng_state
+from profiling import StepProfiler
+from distributed import (is_main_process, get_rank, all_reduce_sum,
+                         all_gather_object, unwrap_model)
 
 
-class TextEncoder(nn.Module):
-    def __init__(self):
-        super().__init__()
-        self.bert = BertModel.from_pretrained('bert-base-uncased')
+def distillation_loss(student_logits, teacher_logits, temperature):
+    # Hinton et al.: KL between softened distributions, scaled by T^2 so its
+    # gradients stay comparable to the hard-label loss
+    return F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction='batchmean') * temperature ** 2
 
-        for param in self.bert.parameters():
-            param.requires_grad = False
 
-        self.projection = nn.Linear(768, 128)
-
-    def forward(self, input_ids, attention_mask):
-        # Extract BERT embeddings
-        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
-
-        # Use [CLS] token representation
-        pooler_output = outputs.pooler_output
-
-        return self.projection(pooler_output)
-
-
-class VideoEncoder(nn.Module):
-    def __init__(self):
-        super().__init__()
-        self.backbone = vision_models.video.r3d_18(pretrained=True)
-
-        for param in self.backbone.parameters():
-            param.requires_grad = False
-
-        num_fts = self.backbone.fc.in_features
-        self.backbone.fc = nn.Sequential(
-            nn.Linear(num_fts, 128),
-            nn.ReLU(),
-            nn.Dropout(0.2)
-        )
-
-    def forward(self, x):
-        # [batch_size, frames, channels, height, width]->[batch_size, channels, frames, height, width]
-        x = x.transpose(1, 2)
-        return self.backbone(x)
-
-
-class AudioEncoder(nn.Module):
-    def __init__(self):
-        super().__init__()
-        self.conv_layers = nn.Sequential(
-            # Lower level features
-            nn.Conv1d(64, 64, kernel_size=3),
-            nn.BatchNorm1d(64),
-            nn.ReLU(),
-            nn.MaxPool1d(2),
-            # Higher level features
-            nn.Conv1d(64, 128, kernel_size=3),
-            nn.BatchNorm1d(128),
-            nn.ReLU(),
-            nn.AdaptiveAvgPool1d(1)
-        )
-
-        for param in self.conv_layers.parameters():
-            param.requires_grad = False
-
-        self.projection = nn.Sequential(
-            nn.Linear(128, 128),
-            nn.ReLU(),
-            nn.Dropout(0.2)
-        )
-
-    def forward(self, x):
-        x = x.squeeze(1)
-
-        features = self.conv_layers(x)
-        # Features output: [batch_size, 128, 1]
-
-        return self.projection(features.squeeze(-1))
-
-
-class MultimodalSentimentModel(nn.Module):
-    def __init__(self):
-        super().__init__()
-
-        # Encoders
-        self.text_encoder = TextEncoder()
-        self.video_encoder = VideoEncoder()
-        self.audio_encoder = AudioEncoder()
-
-        # Fusion layer
-        self.fusion_layer = nn.Sequential(
-            nn.Linear(128 * 3, 256),
-            nn.BatchNorm1d(256),
-            nn.ReLU(),
-            nn.Dropout(0.3)
-        )
-
-        # Classification heads
-        self.emotion_classifier = nn.Sequential(
-            nn.Linear(256, 64),
-            nn.ReLU(),
-            nn.Dropout(0.2),
-            nn.Linear(64, 7)  # Sadness, anger
-        )
-
-        self.sentiment_classifier = nn.Sequential(
-            nn.Linear(256, 64),
-            nn.ReLU(),
-            nn.Dropout(0.2),
-            nn.Linear(64, 3)  # Negative, positive, neutral
-        )
-
-    def forward(self, text_inputs, video_frames, audio_features):
-        text_features = self.text_encoder(
-            text_inputs['input_ids'],
-            text_inputs['attention_mask'],
-        )
-        video_features = self.video_encoder(video_frames)
-        audio_features = self.audio_encoder(audio_features)
-
-        # Concatenate multimodal features
-        combined_features = torch.cat([
-            text_features,
-            video_features,
-            audio_features
-        ], dim=1)  # [batch_size, 128 * 3]
-
-        fused_features = self.fusion_layer(combined_features)
-
-        emotion_output = self.emotion_classifier(fused_features)
-        sentiment_output = self.sentiment_classifier(fused_features)
-
-        return {
-            'emotions': emotion_output,
-            'sentiments': sentiment_output
-        }
-
-
-def compute_class_weights(dataset):
+def compute_class_weights(dataset, verbose=True):
     emotion_counts = torch.zeros(7)
     sentiment_counts = torch.zeros(3)
     skipped = 0
     total = len(dataset)
 
-    print("\Counting class distributions...")
-    for i in range(total):
-        sample = dataset[i]
+    if verbose:
+        print("\Counting class distributions...")
+    if hasattr(dataset, 'get_labels'):
+        # Labels come straight from the CSV, no need to decode every clip
+        emotion_labels, sentiment_labels = dataset.get_labels()
+        emotion_counts += torch.bincount(emotion_labels, minlength=7)
+        sentiment_counts += torch.bincount(sentiment_labels, minlength=3)
+    else:
+        for i in range(total):
+            sample = dataset[i]
 
-        if sample is None:
-            skipped += 1
-            continue
+            if sample is None:
+                skipped += 1
+                continue
 
-        emotion_label = sample['emotion_label']
-        sentiment_label = sample['sentiment_label']
+            emotion_label = sample['emotion_label']
+            sentiment_label = sample['sentiment_label']
 
-        emotion_counts[emotion_label] += 1
-        sentiment_counts[sentiment_label] += 1
+            emotion_counts[emotion_label] += 1
+            sentiment_counts[sentiment_label] += 1
 
     valid = total - skipped
-    print(f"Skipped samples: {skipped}/{total}")
+    if verbose:
+        print(f"Skipped samples: {skipped}/{total}")
 
-    print("\nClass distribution")
-    print("Emotions:")
-    emotion_map = {0: 'anger', 1: 'disgust', 2: 'fear',
-                   3: 'joy', 4: 'neutral', 5: 'sadness', 6: 'surprise'}
-    for i, count in enumerate(emotion_counts):
-        print(f"{emotion_map[i]}: {count/valid:.2f}")
+        print("\nClass distribution")
+        print("Emotions:")
+        emotion_map = {0: 'anger', 1: 'disgust', 2: 'fear',
+                       3: 'joy', 4: 'neutral', 5: 'sadness', 6: 'surprise'}
+        for i, count in enumerate(emotion_counts):
+            print(f"{emotion_map[i]}: {count/valid:.2f}")
 
-    print("\nSentiments:")
-    sentiment_map = {0: 'negative', 1: 'neutral', 2: 'positive'}
-    for i, count in enumerate(sentiment_counts):
-        print(f"{sentiment_map[i]}: {count/valid:.2f}")
+        print("\nSentiments:")
+        sentiment_map = {0: 'negative', 1: 'neutral', 2: 'positive'}
+        for i, count in enumerate(sentiment_counts):
+            print(f"{sentiment_map[i]}: {count/valid:.2f}")
 
     # Calculate class weights
     emotion_weights = 1.0 / emotion_counts
@@ -189,36 +82,96 @@ def compute_class_weights(dataset):
     return emotion_weights, sentiment_weights
 
 
+# Scalar metrics returned by MultimodalTrainer.evaluate, as "emotion_f1" etc.
+EVALUATION_METRICS = [(name, key) for name in ['emotion', 'sentiment']
+                      for key in ['precision', 'accuracy', 'recall', 'f1']]
+
+
+def trainable_parameters(module):
+    return [param for param in module.parameters() if param.requires_grad]
+
+
 class MultimodalTrainer:
-    def __init__(self, model, train_loader, val_loader):
+    def __init__(self, model, train_loader, val_loader, accumulation_steps=1,
+                 log_interval=50, checkpoint_manager=None, checkpoint_every=0,
+                 early_stopping=None, profiler=None, teacher=None,
+                 distill_alpha=0.5, distill_temperature=2.0):
+        # model may be wrapped in DistributedDataParallel
         self.model = model
+        # With a teacher, each head's loss mixes the hard labels with the
+        # teacher's softened logits, weighted by distill_alpha
+        self.teacher = teacher
+        self.distill_alpha = distill_alpha
+        self.distill_temperature = distill_temperature
+        if teacher is not None:
+            teacher.eval()
+            for param in teacher.parameters():
+                param.requires_grad = False
         self.train_loader = train_loader
         self.val_loader = val_loader
+        self.accumulation_steps = accumulation_steps
+        # Training losses stay on the device and are only read back every
+        # log_interval batches
+        self.log_interval = log_interval
+        # Full training state is saved every checkpoint_every optimizer steps
+        self.checkpoint_manager = checkpoint_manager
+        self.checkpoint_every = checkpoint_every
+        self.early_stopping = early_stopping
+        self.is_main = is_main_process()
+        # A disabled profiler keeps the training loop free of branches
+        self.profiler = profiler or StepProfiler(enabled=False)
 
         # Log dataset sized
         train_size = len(train_loader.dataset)
         val_size = len(val_loader.dataset)
-        print("\nDataset sizes:")
-        print(f"Training samples: {train_size:,}")
-        print(f"Validation samples: {val_size:,}")
-        print(f"Batches per epoch: {len(train_loader):,}")
-
-        timestamp = datetime.now().strftime('%b%d_%H-%M-%S')  # Dec17_14-22-35
-        base_dir = '/opt/ml/output/tensorboard' if 'SM_MODEL_DIR' in os.environ else 'runs'
-        log_dir = f"{base_dir}/run_{timestamp}"
-        self.writer = SummaryWriter(log_dir=log_dir)
+        if self.is_main:
+            print("\nDataset sizes:")
+            print(f"Training samples: {train_size:,}")
+            print(f"Validation samples: {val_size:,}")
+            print(f"Batches per epoch: {len(train_loader):,}")
+
+        # Only rank 0 writes TensorBoard events
+        self.writer = None
+        if self.is_main:
+            timestamp = datetime.now().strftime('%b%d_%H-%M-%S')  # Dec17_14-22-35
+            base_dir = '/opt/ml/output/tensorboard' if 'SM_MODEL_DIR' in os.environ else 'runs'
+            log_dir = f"{base_dir}/run_{timestamp}"
+            self.writer = AsyncSummaryWriter(log_dir=log_dir)
         self.global_step = 0
+        self.epoch = 0
+        # Batches of the current epoch already trained, non-zero only when
+        # resuming from a mid-epoch checkpoint
+        self.batch_in_epoch = 0
+        self.best_val_loss = float('inf')
+        self.epoch_peak_memory = 0.0
+
+        base_model = unwrap_model(model)
+        self.profiler.attach(base_model)
 
         # Very high: 1, high: 0.1-0.01, medium: 1e-1, low: 1e-4, very low: 1e-5
+        # Frozen parameters are left out so the optimizer holds no state for them
+        learning_rates = getattr(base_model, 'learning_rates',
+                                 MultimodalFusionModel.learning_rates)
         self.optimizer = torch.optim.Adam([
-            {'params': model.text_encoder.parameters(), 'lr': 8e-6},
-            {'params': model.video_encoder.parameters(), 'lr': 8e-5},
-            {'params': model.audio_encoder.parameters(), 'lr': 8e-5},
-            {'params': model.fusion_layer.parameters(), 'lr': 5e-4},
-            {'params': model.emotion_classifier.parameters(), 'lr': 5e-4},
-            {'params': model.sentiment_classifier.parameters(), 'lr': 5e-4}
+            {'params': trainable_parameters(base_model.text_encoder),
+             'lr': learning_rates['text_encoder']},
+            {'params': trainable_parameters(base_model.video_encoder),
+             'lr': learning_rates['video_encoder']},
+            {'params': trainable_parameters(base_model.audio_encoder),
+             'lr': learning_rates['audio_encoder']},
+            {'params': trainable_parameters(base_model.fusion_layer), 'lr': 5e-4},
+            {'params': trainable_parameters(base_model.emotion_classifier), 'lr': 5e-4},
+            {'params': trainable_parameters(base_model.sentiment_classifier), 'lr': 5e-4}
         ], weight_decay=1e-5)
 
+        if self.is_main:
+            frozen = [p for p in base_model.parameters() if not p.requires_grad]
+            frozen_mb = sum(p.numel() * p.element_size()
+                            for p in frozen) / 1024**2
+            print(f"\nFrozen parameters: {sum(p.numel() for p in frozen):,} "
+                  f"({frozen_mb:.1f} MB), excluded from the optimizer and "
+                  f"run without autograd")
+
         self.scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(
             self.optimizer,
             mode="min",
@@ -229,17 +182,19 @@ class MultimodalTrainer:
         self.current_train_losses = None
 
         # Calculate calss weights
-        print("\nCalculating class weights...")
+        if self.is_main:
+            print("\nCalculating class weights...")
         emotion_weights, sentiment_weights = compute_class_weights(
-            train_loader.dataset)
+            train_loader.dataset, verbose=self.is_main)
 
         device = next(model.parameters()).device
 
         self.emotion_weights = emotion_weights.to(device)
         self.sentiment_weights = sentiment_weights.to(device)
 
-        print(f"Emotion weights on device: {self.emotion_weights.device}")
-        print(f"Sentiments weights on device: {self.sentiment_weights.device}")
+        if self.is_main:
+            print(f"Emotion weights on device: {self.emotion_weights.device}")
+            print(f"Sentiments weights on device: {self.sentiment_weights.device}")
 
         self.emotion_criterion = nn.CrossEntropyLoss(
             label_smoothing=0.05,
@@ -252,23 +207,20 @@ class MultimodalTrainer:
         )
 
     def log_metrics(self, losses, metrics=None, phase="train"):
+        if self.writer is None:
+            return
+
         if phase == "train":
             self.current_train_losses = losses
         else:  # Validation phase
-            self.writer.add_scalar(
-                'loss/total/train', self.current_train_losses['total'], self.global_step)
-            self.writer.add_scalar(
-                'loss/total/val', losses['total'], self.global_step)
-
-            self.writer.add_scalar(
-                'loss/emotion/train', self.current_train_losses['emotion'], self.global_step)
-            self.writer.add_scalar(
-                'loss/emotion/val', losses['emotion'], self.global_step)
-
-            self.writer.add_scalar(
-                'loss/sentiment/train', self.current_train_losses['sentiment'], self.global_step)
-            self.writer.add_scalar(
-                'loss/sentiment/val', losses['sentiment'], self.global_step)
+            for key in ['total', 'emotion', 'sentiment']:
+                # An evaluation early in an epoch can come before the first
+                # training log interval
+                if self.current_train_losses is not None:
+                    self.writer.add_scalar(
+                        f'loss/{key}/train', self.current_train_losses[key], self.global_step)
+                self.writer.add_scalar(
+                    f'loss/{key}/val', losses[key], self.global_step)
 
         if metrics:
             self.writer.add_scalar(
@@ -279,70 +231,236 @@ class MultimodalTrainer:
                 f'{phase}/sentiment_precision', metrics['sentiment_precision'], self.global_step)
             self.writer.add_scalar(
                 f'{phase}/sentiment_accuracy', metrics['sentiment_accuracy'], self.global_step)
+            for key in ['emotion_recall', 'emotion_f1', 'sentiment_recall', 'sentiment_f1']:
+                if key in metrics:
+                    self.writer.add_scalar(
+                        f'{phase}/{key}', metrics[key], self.global_step)
 
-    def train_epoch(self):
-        self.model.train()
-        running_loss = {'total': 0, 'emotion': 0, 'sentiment': 0}
-
-        for batch in self.train_loader:
-            device = next(self.model.parameters()).device
-            text_inputs = {
-                'input_ids': batch['text_inputs']['input_ids'].to(device),
-                'attention_mask': batch['text_inputs']['attention_mask'].to(device)
-            }
-            video_frames = batch['video_frames'].to(device)
-            audio_features = batch['audio_features'].to(device)
-            emotion_labels = batch['emotion_label'].to(device)
-            sentiment_labels = batch['sentiment_label'].to(device)
+    @property
+    def should_stop(self):
+        return self.early_stopping is not None and self.early_stopping.should_stop
 
-            # Zero gradient
-            self.optimizer.zero_grad()
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
 
-            # Forward pass
-            outputs = self.model(text_inputs, video_frames, audio_features)
+    def state_dict(self):
+        return {
+            'model': unwrap_model(self.model).state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'scheduler': self.scheduler.state_dict(),
+            'global_step': self.global_step,
+            'epoch': self.epoch,
+            'batch_in_epoch': self.batch_in_epoch,
+            'best_val_loss': self.best_val_loss,
+            'early_stopping': (self.early_stopping.state_dict()
+                               if self.early_stopping is not None else None),
+            # Every rank has its own RNG streams
+            'rng': all_gather_object(capture_rng_state())
+        }
 
-            # Calculate losses using raw logits
-            emotion_loss = self.emotion_criterion(
-                outputs["emotions"], emotion_labels)
-            sentiment_loss = self.sentiment_criterion(
-                outputs["sentiments"], sentiment_labels)
-            total_loss = emotion_loss + sentiment_loss
+    def load_state_dict(self, state):
+        unwrap_model(self.model).load_state_dict(state['model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.scheduler.load_state_dict(state['scheduler'])
+        self.global_step = state['global_step']
+        self.epoch = state['epoch']
+        self.batch_in_epoch = state['batch_in_epoch']
+        self.best_val_loss = state['best_val_loss']
+        if self.early_stopping is not None and state.get('early_stopping'):
+            self.early_stopping.load_state_dict(state['early_stopping'])
+        if get_rank() < len(state['rng']):
+            restore_rng_state(state['rng'][get_rank()])
+
+    def save_checkpoint(self):
+        # Collective (RNG gather), so every rank calls it; rank 0 writes
+        state = self.state_dict()
+        if self.is_main and self.checkpoint_manager is not None:
+            path = self.checkpoint_manager.save(state, self.global_step)
+            print(f"Saved checkpoint {path}")
+
+    def resume(self, path):
+        device = next(self.model.parameters()).device
+        self.load_state_dict(
+            self.checkpoint_manager.load(path, map_location=device))
+        if self.is_main:
+            print(f"Resumed from {path}: epoch {self.epoch}, "
+                  f"batch {self.batch_in_epoch}, step {self.global_step}")
+
+    def train_epoch(self, step_callback=None):
+        # step_callback(global_step) runs after every optimizer step, e.g.
+        # for step-based evaluation; an early stop ends the epoch there
+        self.model.train()
 
-            # Backward pass. Calculate gradients
-            total_loss.backward()
+        # Reshuffle the per-rank shards differently every epoch, and skip
+        # what a resumed checkpoint already trained on
+        sampler = self.train_loader.sampler
+        if isinstance(self.train_loader.dataset, IterableDataset):
+            # Streamed datasets order their own samples
+            sampler = self.train_loader.dataset
+        start_batch = self.batch_in_epoch
+        if hasattr(sampler, 'set_epoch'):
+            sampler.set_epoch(self.epoch)
+        if hasattr(sampler, 'set_start_index'):
+            sampler.set_start_index(start_batch * self.train_loader.batch_size)
+        else:
+            start_batch = 0
+
+        device = next(self.model.parameters()).device
+        # [total, emotion, sentiment], summed on the device
+        running_loss = torch.zeros(3, device=device)
+        window_loss = torch.zeros(3, device=device)
+        window_batches = 0
+        trained_batches = 0
+        num_batches = start_batch + len(self.train_loader)
+        self.optimizer.zero_grad()
+        self.epoch_peak_memory = 0.0
+        self.profiler.restart_clock()
+
+        for batch_idx, batch in enumerate(self.train_loader, start=start_batch):
+            self.profiler.begin_step()
+            # The last accumulation window of an epoch can be shorter, scale
+            # its losses by the batches it actually holds
+            window_start = batch_idx - batch_idx % self.accumulation_steps
+            window_size = min(self.accumulation_steps,
+                              num_batches - window_start)
+            is_boundary = batch_idx + 1 == window_start + window_size
+
+            if device.type == 'cuda':
+                torch.cuda.reset_peak_memory_stats(device)
+
+            with self.profiler.section('h2d'):
+                text_inputs = {
+                    'input_ids': batch['text_inputs']['input_ids'].to(device),
+                    'attention_mask': batch['text_inputs']['attention_mask'].to(device)
+                }
+                video_frames = batch['video_frames'].to(device)
+                audio_features = batch['audio_features'].to(device)
+                emotion_labels = batch['emotion_label'].to(device)
+                sentiment_labels = batch['sentiment_label'].to(device)
 
-            # Gradient clipping
-            torch.nn.utils.clip_grad_norm_(
-                self.model.parameters(), max_norm=1.0)
+            # Skip the DDP gradient all-reduce until the window is complete
+            sync_context = nullcontext()
+            if not is_boundary and hasattr(self.model, 'no_sync'):
+                sync_context = self.model.no_sync()
 
-            self.optimizer.step()
+            with sync_context:
+                # Forward pass
+                outputs = self.model(text_inputs, video_frames, audio_features)
 
-            # Track losses
-            running_loss['total'] += total_loss.item()
-            running_loss['emotion'] += emotion_loss.item()
-            running_loss['sentiment'] += sentiment_loss.item()
+                # Calculate losses using raw logits
+                emotion_loss = self.emotion_criterion(
+                    outputs["emotions"], emotion_labels)
+                sentiment_loss = self.sentiment_criterion(
+                    outputs["sentiments"], sentiment_labels)
 
-            self.log_metrics({
-                'total': total_loss.item(),
-                'emotion': emotion_loss.item(),
-                'sentiment': sentiment_loss.item()
-            })
+                if self.teacher is not None:
+                    with torch.no_grad():
+                        teacher_outputs = self.teacher(
+                            text_inputs, video_frames, audio_features)
+                    alpha = self.distill_alpha
+                    emotion_loss = (1 - alpha) * emotion_loss + alpha * distillation_loss(
+                        outputs["emotions"], teacher_outputs["emotions"],
+                        self.distill_temperature)
+                    sentiment_loss = (1 - alpha) * sentiment_loss + alpha * distillation_loss(
+                        outputs["sentiments"], teacher_outputs["sentiments"],
+                        self.distill_temperature)
 
-            self.global_step += 1
+                total_loss = emotion_loss + sentiment_loss
 
-        return {k: v/len(self.train_loader) for k, v in running_loss.items()}
+                # Backward pass. Calculate gradients
+                with self.profiler.section('backward'):
+                    (total_loss / window_size).backward()
+
+            if is_boundary:
+                with self.profiler.section('optimizer'):
+                    # Gradient clipping on the accumulated gradients
+                    torch.nn.utils.clip_grad_norm_(
+                        self.model.parameters(), max_norm=1.0)
+
+                    self.optimizer.step()
+                    self.optimizer.zero_grad()
+            self.profiler.end_step(emotion_labels.size(0))
+
+            if is_boundary:
+                self.global_step += 1
+                self.batch_in_epoch = batch_idx + 1
+
+                if step_callback is not None:
+                    step_callback(self.global_step)
+
+                # Only at window boundaries, so no partial gradients are lost,
+                # and after the callback so it records that step's evaluation
+                if self.checkpoint_every and self.global_step % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+
+            if device.type == 'cuda':
+                peak_memory = torch.cuda.max_memory_allocated(device) / 1024**3
+                self.epoch_peak_memory = max(self.epoch_peak_memory, peak_memory)
+                if self.writer is not None:
+                    self.writer.add_scalar(
+                        'memory/step_peak_gb', peak_memory, self.global_step)
+
+            # Track losses without reading them back to the host
+            step_loss = torch.stack(
+                [total_loss, emotion_loss, sentiment_loss]).detach()
+            running_loss += step_loss
+            window_loss += step_loss
+            window_batches += 1
+            trained_batches += 1
+
+            if window_batches == self.log_interval or batch_idx + 1 == num_batches:
+                # The background writer resolves these tensors
+                window_mean = window_loss / window_batches
+                self.log_metrics({
+                    'total': window_mean[0],
+                    'emotion': window_mean[1],
+                    'sentiment': window_mean[2]
+                })
+                window_loss = torch.zeros_like(window_loss)
+                window_batches = 0
+                self.profiler.log(self.writer, self.global_step)
+
+            if is_boundary and self.should_stop:
+                break
+            self.profiler.restart_clock()
+
+        self.epoch += 1
+        self.batch_in_epoch = 0
+        if hasattr(sampler, 'set_start_index'):
+            sampler.set_start_index(0)
+
+        # Average over every rank's batches, the only sync of the epoch
+        totals = all_reduce_sum(torch.cat([
+            running_loss.double(),
+            torch.tensor([trained_batches], dtype=torch.float64, device=device)
+        ])).tolist()
+        # A checkpoint saved on the last step of an epoch resumes into an
+        # empty one. Its losses were never checkpointed, so there are none
+        # to report
+        if totals[3] == 0:
+            return {k: float('nan') for k in ['total', 'emotion', 'sentiment']}
+        return {k: totals[i] / totals[3]
+                for i, k in enumerate(['total', 'emotion', 'sentiment'])}
 
     def evaluate(self, data_loader, phase="val"):
-        self.model.eval()
-        losses = {'total': 0, 'emotion': 0, 'sentiment': 0}
-        all_emotion_preds = []
-        all_emotion_labels = []
-        all_sentiment_preds = []
-        all_sentiment_labels = []
+        # Ranks can see a different number of eval batches, so run the bare
+        # module and only synchronize once at the end
+        model = unwrap_model(self.model)
+        # Evaluation can run in the middle of an epoch
+        was_training = model.training
+        model.eval()
+        device = next(model.parameters()).device
+        emotion_matrix = ConfusionMatrix(7, device=device)
+        sentiment_matrix = ConfusionMatrix(3, device=device)
 
         with torch.inference_mode():
+            # [total, emotion, sentiment], summed on the device
+            losses = torch.zeros(3, device=device)
+            # Counted, as streamed splits read by several DataLoader workers
+            # end with a partial batch per worker
+            num_batches = 0
             for batch in data_loader:
-                device = next(self.model.parameters()).device
                 text_inputs = {
                     'input_ids': batch['text_inputs']['input_ids'].to(device),
                     'attention_mask': batch['text_inputs']['attention_mask'].to(device)
@@ -352,7 +470,7 @@ class MultimodalTrainer:
                 emotion_labels = batch['emotion_label'].to(device)
                 sentiment_labels = batch['sentiment_label'].to(device)
 
-                outputs = self.model(text_inputs, video_frames, audio_features)
+                outputs = model(text_inputs, video_frames, audio_features)
 
                 emotion_loss = self.emotion_criterion(
                     outputs["emotions"], emotion_labels)
@@ -360,46 +478,42 @@ class MultimodalTrainer:
                     outputs["sentiments"], sentiment_labels)
                 total_loss = emotion_loss + sentiment_loss
 
-                all_emotion_preds.extend(
-                    outputs["emotions"].argmax(dim=1).cpu().numpy())
-                all_emotion_labels.extend(emotion_labels.cpu().numpy())
-                all_sentiment_preds.extend(
-                    outputs["sentiments"].argmax(dim=1).cpu().numpy())
-                all_sentiment_labels.extend(sentiment_labels.cpu().numpy())
+                emotion_matrix.update(
+                    outputs["emotions"].argmax(dim=1), emotion_labels)
+                sentiment_matrix.update(
+                    outputs["sentiments"].argmax(dim=1), sentiment_labels)
 
                 # Track losses
-                losses['total'] += total_loss.item()
-                losses['emotion'] += emotion_loss.item()
-                losses['sentiment'] += sentiment_loss.item()
-
-        avg_loss = {k: v/len(data_loader) for k, v in losses.items()}
-
-        # Compute the precision and accuracy
-        emotion_precision = precision_score(
-            all_emotion_labels, all_emotion_preds, average='weighted')
-        emotion_accuracy = accuracy_score(
-            all_emotion_labels, all_emotion_preds)
-        sentiment_precision = precision_score(
-            all_sentiment_labels, all_sentiment_preds, average='weighted')
-        sentiment_accuracy = accuracy_score(
-            all_sentiment_labels, all_sentiment_preds)
-
-        self.log_metrics(avg_loss, {
-            'emotion_precision': emotion_precision,
-            'emotion_accuracy': emotion_accuracy,
-            'sentiment_precision': sentiment_precision,
-            'sentiment_accuracy': sentiment_accuracy
-        }, phase=phase)
+                losses += torch.stack(
+                    [total_loss, emotion_loss, sentiment_loss])
+                num_batches += 1
+
+        totals = all_reduce_sum(torch.cat([
+            losses.double(),
+            torch.tensor([num_batches], dtype=torch.float64, device=device)
+        ])).tolist()
+        avg_loss = {k: totals[i] / totals[3]
+                    for i, k in enumerate(['total', 'emotion', 'sentiment'])}
+
+        emotion_stats = emotion_matrix.all_reduce().compute()
+        sentiment_stats = sentiment_matrix.all_reduce().compute()
+
+        stats = {'emotion': emotion_stats, 'sentiment': sentiment_stats}
+        metrics = {f'{name}_{key}': stats[name][key]
+                   for name, key in EVALUATION_METRICS}
+
+        self.log_metrics(avg_loss, metrics, phase=phase)
+
+        metrics['emotion_per_class'] = emotion_stats['per_class']
+        metrics['sentiment_per_class'] = sentiment_stats['per_class']
 
         if phase == "val":
             self.scheduler.step(avg_loss['total'])
 
-        return avg_loss, {
-            'emotion_precision': emotion_precision,
-            'emotion_accuracy': emotion_accuracy,
-            'sentiment_precision': sentiment_precision,
-            'sentiment_accuracy': sentiment_accuracy
-        }
+        if was_training:
+            model.train()
+
+        return avg_loss, metrics
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+from tqdm import tqdm
+
+from meld_dataset import MELDDataset, video_filename, shards_dir_for
+import bootstrap  # noqa: F401
+from preprocessing import thread_budget, apply_thread_budget
+
+# Set in each worker process by init_worker
+worker_dataset = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, required=True)
+    parser.add_argument("--video-dir", type=str, required=True)
+    parser.add_argument("--output-dir", type=str, default=None)
+    parser.add_argument("--samples-per-shard", type=int, default=256)
+    parser.add_argument("--decoded", action="store_true",
+                        help="Store preprocessed tensors instead of the clips. "
+                             "Shards are much larger but need no decoding")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    return parser.parse_args()
+
+
+def init_worker(csv_path, video_dir, workers):
+    global worker_dataset
+    apply_thread_budget(thread_budget(workers=workers))
+    worker_dataset = MELDDataset(csv_path, video_dir)
+
+
+def shard_filename(shard_id):
+    return f"shard-{shard_id:05d}.tar"
+
+
+def add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    # Fixed metadata, so repacking the same samples gives identical shards
+    info.mtime = 0
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def sample_metadata(dataset, idx):
+    row = dataset.data.iloc[idx]
+    return {
+        'dialogue_id': int(row['Dialogue_ID']),
+        'utterance_id': int(row['Utterance_ID']),
+        'utterance': row['Utterance'],
+        'emotion_label': dataset.emotion_map[row['Emotion'].lower()],
+        'sentiment_label': dataset.sentiment_map[row['Sentiment'].lower()]
+    }
+
+
+def sample_payload(dataset, idx, decoded):
+    if decoded:
+        sample = dataset.load_sample(idx, frames_as_uint8=True)
+        buffer = io.BytesIO()
+        torch.save(sample, buffer)
+        return 'pth', buffer.getvalue()
+
+    path = os.path.join(dataset.video_dir, video_filename(dataset.data.iloc[idx]))
+    with open(path, 'rb') as f:
+        return 'mp4', f.read()
+
+
+def write_shard(shard_id, indices, output_dir, decoded):
+    failed = 0
+    path = os.path.join(output_dir, shard_filename(shard_id))
+    # Write then rename, so an interrupted run never leaves a partial shard
+    with tarfile.open(path + '.tmp', 'w') as tar:
+        for idx in indices:
+            key = os.path.splitext(video_filename(worker_dataset.data.iloc[idx]))[0]
+            try:
+                extension, payload = sample_payload(worker_dataset, idx, decoded)
+            except Exception as e:
+                print(f"Skipping {key}: {str(e)}")
+                failed += 1
+                continue
+
+            metadata = sample_metadata(worker_dataset, idx)
+            add_member(tar, f"{key}.json", json.dumps(metadata).encode())
+            add_member(tar, f"{key}.{extension}", payload)
+    os.replace(path + '.tmp', path)
+
+    return shard_id, failed
+
+
+def read_shard_summary(output_dir, shard_id):
+    # Sample count and labels for the index, from the shard's metadata
+    # members. Random access skips over the clips.
+    filename = shard_filename(shard_id)
+    path = os.path.join(output_dir, filename)
+    emotion_labels = []
+    sentiment_labels = []
+    with tarfile.open(path) as tar:
+        for member in tar:
+            if member.name.endswith('.json'):
+                metadata = json.load(tar.extractfile(member))
+                emotion_labels.append(metadata['emotion_label'])
+                sentiment_labels.append(metadata['sentiment_label'])
+
+    return {
+        'file': filename,
+        'size': len(emotion_labels),
+        'bytes': os.path.getsize(path),
+        'emotion_labels': emotion_labels,
+        'sentiment_labels': sentiment_labels
+    }
+
+
+def main():
+    args = parse_args()
+    output_dir = args.output_dir or shards_dir_for(args.video_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    dataset = MELDDataset(args.csv, args.video_dir)
+    total = len(dataset)
+    shard_format = 'decoded' if args.decoded else 'raw'
+
+    # The shard layout has to match for a restart to reuse finished shards
+    plan = {'csv': os.path.abspath(args.csv), 'total': total,
+            'samples_per_shard': args.samples_per_shard, 'format': shard_format}
+    if args.decoded:
+        plan['preprocessing'] = dataset.preprocessing.to_dict()
+    plan_path = os.path.join(output_dir, 'plan.json')
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            if json.load(f) != plan:
+                raise ValueError(
+                    f"{output_dir} was created with different settings, use a new --output-dir")
+    else:
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+
+    shards = [list(range(start, min(start + args.samples_per_shard, total)))
+              for start in range(0, total, args.samples_per_shard)]
+    pending = [shard_id for shard_id in range(len(shards))
+               if not os.path.exists(os.path.join(output_dir, shard_filename(shard_id)))]
+
+    print(f"{total} samples in {len(shards)} {shard_format} shards, "
+          f"{len(shards) - len(pending)} already done")
+
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=init_worker,
+                             initargs=(args.csv, args.video_dir, args.workers)) as executor:
+        futures = [executor.submit(write_shard, shard_id, shards[shard_id],
+                                   output_dir, args.decoded)
+                   for shard_id in pending]
+        failed = 0
+        with tqdm(total=len(pending), desc="Shards") as progress:
+            for future in as_completed(futures):
+                _, shard_failed = future.result()
+                failed += shard_failed
+                progress.update(1)
+                progress.set_postfix(failed=failed)
+
+    index = {'version': 1, 'format': shard_format,
+             'csv': os.path.basename(args.csv), 'shards': []}
+    # Decoded shards can only be used with the settings they were made with
+    if args.decoded:
+        index['preprocessing'] = dataset.preprocessing.to_dict()
+    for shard_id in range(len(shards)):
+        summary = read_shard_summary(output_dir, shard_id)
+        if summary['size'] > 0:
+            index['shards'].append(summary)
+
+    with open(os.path.join(output_dir, 'index.json.tmp'), 'w') as f:
+        json.dump(index, f)
+    os.replace(os.path.join(output_dir, 'index.json.tmp'),
+               os.path.join(output_dir, 'index.json'))
+
+    packed = sum(shard['size'] for shard in index['shards'])
+    size_mb = sum(shard['bytes'] for shard in index['shards']) / 1024**2
+    print(f"Packed {packed}/{total} samples into {len(index['shards'])} shards "
+          f"({size_mb:.0f} MB) in {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
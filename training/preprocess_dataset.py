@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+from tqdm import tqdm
+
+from meld_dataset import MELDDataset, preprocessed_dir_for
+import bootstrap  # noqa: F401
+from preprocessing import thread_budget, apply_thread_budget
+
+# Set in each worker process by init_worker
+worker_dataset = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, required=True)
+    parser.add_argument("--video-dir", type=str, required=True)
+    parser.add_argument("--output-dir", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=64)
+
+    return parser.parse_args()
+
+
+def init_worker(csv_path, video_dir, workers):
+    global worker_dataset
+    # The pool provides the parallelism, each worker gets its share of cores
+    apply_thread_budget(thread_budget(workers=workers))
+    worker_dataset = MELDDataset(csv_path, video_dir)
+
+
+def chunk_filename(chunk_id):
+    return f"chunk_{chunk_id:05d}.pt"
+
+
+def process_chunk(chunk_id, indices, output_dir):
+    samples = []
+    failed = []
+    for idx in indices:
+        try:
+            samples.append(worker_dataset.load_sample(
+                idx, frames_as_uint8=True))
+        except Exception as e:
+            failed.append({'index': idx, 'error': str(e)})
+
+    chunk = {'failed': failed}
+    if samples:
+        chunk.update({
+            'input_ids': torch.stack([s['text_inputs']['input_ids'] for s in samples]),
+            'attention_mask': torch.stack([s['text_inputs']['attention_mask'] for s in samples]),
+            'video_frames': torch.stack([s['video_frames'] for s in samples]),
+            'audio_features': torch.stack([s['audio_features'] for s in samples]),
+            'emotion_label': torch.stack([s['emotion_label'] for s in samples]),
+            'sentiment_label': torch.stack([s['sentiment_label'] for s in samples])
+        })
+
+    # Write then rename, so an interrupted run never leaves a partial chunk
+    path = os.path.join(output_dir, chunk_filename(chunk_id))
+    torch.save(chunk, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    return chunk_id, len(samples), len(failed)
+
+
+def read_chunk_summary(output_dir, chunk_id):
+    chunk = torch.load(os.path.join(output_dir, chunk_filename(chunk_id)),
+                       mmap=True, weights_only=True)
+    size = len(chunk['emotion_label']) if 'emotion_label' in chunk else 0
+    return size, len(chunk['failed'])
+
+
+def main():
+    args = parse_args()
+    output_dir = args.output_dir or preprocessed_dir_for(args.video_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    dataset = MELDDataset(args.csv, args.video_dir)
+    total = len(dataset)
+
+    # The chunk layout has to match for a restart to reuse finished chunks
+    plan = {'csv': os.path.abspath(args.csv), 'total': total,
+            'chunk_size': args.chunk_size,
+            'preprocessing': dataset.preprocessing.to_dict()}
+    plan_path = os.path.join(output_dir, 'plan.json')
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            if json.load(f) != plan:
+                raise ValueError(
+                    f"{output_dir} was created with different settings, use a new --output-dir")
+    else:
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+
+    chunks = [list(range(start, min(start + args.chunk_size, total)))
+              for start in range(0, total, args.chunk_size)]
+    pending = [chunk_id for chunk_id in range(len(chunks))
+               if not os.path.exists(os.path.join(output_dir, chunk_filename(chunk_id)))]
+
+    print(f"{total} samples in {len(chunks)} chunks, "
+          f"{len(chunks) - len(pending)} already done")
+
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=init_worker,
+                             initargs=(args.csv, args.video_dir, args.workers)) as executor:
+        futures = [executor.submit(process_chunk, chunk_id, chunks[chunk_id], output_dir)
+                   for chunk_id in pending]
+        failed = 0
+        with tqdm(total=len(pending), desc="Chunks") as progress:
+            for future in as_completed(futures):
+                _, _, chunk_failed = future.result()
+                failed += chunk_failed
+                progress.update(1)
+                progress.set_postfix(failed=failed)
+
+    index = {'version': 1, 'csv': os.path.basename(args.csv),
+             'preprocessing': dataset.preprocessing.to_dict(), 'chunks': []}
+    total_failed = 0
+    for chunk_id in range(len(chunks)):
+        size, chunk_failed = read_chunk_summary(output_dir, chunk_id)
+        total_failed += chunk_failed
+        if size > 0:
+            index['chunks'].append({'file': chunk_filename(chunk_id), 'size': size})
+
+    with open(os.path.join(output_dir, 'index.json.tmp'), 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(os.path.join(output_dir, 'index.json.tmp'),
+               os.path.join(output_dir, 'index.json'))
+
+    print(f"Preprocessed {total - total_failed}/{total} samples into {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
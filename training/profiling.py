@@ -0,0 +1,185 @@
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import torch
+
+
+class StepProfiler:
+    # Per-step timings for the training hot path. On CUDA every boundary is a
+    # timing event, and events are only read once they have completed, so
+    # profiling adds no host-device syncs to the step itself.
+    SECTIONS = ['data_wait', 'h2d', 'text_encoder', 'video_encoder',
+                'audio_encoder', 'fusion', 'heads', 'backward', 'optimizer']
+
+    def __init__(self, device=None, enabled=True, trace_dir=None,
+                 trace_start=0, trace_steps=0):
+        self.enabled = enabled
+        self.use_cuda = device is not None and torch.device(device).type == 'cuda'
+        self.device = device
+        self.active = False
+        self.current = None
+        self.pending = []
+        self.timings = {name: [] for name in self.SECTIONS}
+        self.step_times = []
+        self.step_samples = []
+        self.peak_memory = 0.0
+        self.last_step_end = None
+
+        # Optional torch.profiler trace over a window of steps
+        self.trace = None
+        if enabled and trace_dir and trace_steps > 0:
+            self.trace = torch.profiler.profile(
+                schedule=torch.profiler.schedule(
+                    wait=max(trace_start - 1, 0), warmup=1 if trace_start > 0 else 0,
+                    active=trace_steps, repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_dir),
+                record_shapes=True,
+                profile_memory=True)
+            self.trace.start()
+
+    def _marker(self):
+        if self.use_cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def _elapsed_ms(self, start, end):
+        if self.use_cuda:
+            return start.elapsed_time(end)
+        return (end - start) * 1000
+
+    def _ready(self, marker):
+        return not self.use_cuda or marker.query()
+
+    def attach(self, model):
+        # Encoder, fusion and head timings come from forward hooks
+        if not self.enabled:
+            return
+
+        def hook_pair(name, first, last):
+            def pre_hook(module, args):
+                if self.active:
+                    self.current['markers'][name] = [self._marker(), None]
+
+            def post_hook(module, args, output):
+                if self.active and name in self.current['markers']:
+                    self.current['markers'][name][1] = self._marker()
+
+            first.register_forward_pre_hook(pre_hook)
+            last.register_forward_hook(post_hook)
+
+        hook_pair('text_encoder', model.text_encoder, model.text_encoder)
+        hook_pair('video_encoder', model.video_encoder, model.video_encoder)
+        hook_pair('audio_encoder', model.audio_encoder, model.audio_encoder)
+        hook_pair('fusion', model.fusion_layer, model.fusion_layer)
+        hook_pair('heads', model.emotion_classifier, model.sentiment_classifier)
+
+    def restart_clock(self):
+        # Data wait is measured from here to the next begin_step, so work
+        # between steps (evaluation, checkpointing) is not counted as loading
+        self.last_step_end = time.perf_counter()
+
+    def begin_step(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.active = True
+        self.current = {
+            'markers': {},
+            'data_wait': (now - self.last_step_end) * 1000 if self.last_step_end else 0.0,
+            'start_time': now
+        }
+
+    @contextmanager
+    def _record(self, name):
+        start = self._marker()
+        yield
+        self.current['markers'][name] = [start, self._marker()]
+
+    def section(self, name):
+        if not self.enabled or not self.active:
+            return nullcontext()
+        return self._record(name)
+
+    def end_step(self, num_samples):
+        if not self.enabled:
+            return
+        step = self.current
+        step['step_time'] = (time.perf_counter() - step['start_time']
+                             + step['data_wait'] / 1000)
+        step['num_samples'] = num_samples
+        self.pending.append(step)
+        self.current = None
+        self.active = False
+
+        if self.use_cuda:
+            self.peak_memory = max(self.peak_memory,
+                                   torch.cuda.max_memory_allocated(self.device) / 1024**3)
+        if self.trace is not None:
+            self.trace.step()
+
+    def collect(self, wait=False):
+        # Move finished steps from pending into the timing lists. Without
+        # wait, steps whose events have not completed are left for later
+        if wait and self.use_cuda and self.pending:
+            torch.cuda.synchronize(self.device)
+
+        resolved = []
+        while self.pending:
+            step = self.pending[0]
+            markers = [end for _, end in step['markers'].values() if end is not None]
+            if markers and not wait and not self._ready(markers[-1]):
+                break
+
+            self.pending.pop(0)
+            timings = {'data_wait': step['data_wait']}
+            for name, (start, end) in step['markers'].items():
+                if end is not None:
+                    timings[name] = self._elapsed_ms(start, end)
+            for name, value in timings.items():
+                self.timings[name].append(value)
+            self.step_times.append(step['step_time'])
+            self.step_samples.append(step['num_samples'])
+            resolved.append(timings)
+        return resolved
+
+    def log(self, writer, step):
+        resolved = self.collect()
+        if writer is None or not resolved:
+            return
+        for name in self.SECTIONS:
+            values = [timings[name] for timings in resolved if name in timings]
+            if values:
+                writer.add_scalar(f'profile/{name}_ms', float(np.mean(values)), step)
+        writer.add_scalar('profile/samples_per_sec',
+                          sum(self.step_samples[-len(resolved):])
+                          / max(sum(self.step_times[-len(resolved):]), 1e-9), step)
+        if self.use_cuda:
+            writer.add_scalar('profile/peak_memory_gb', self.peak_memory, step)
+
+    def summary(self):
+        self.collect(wait=True)
+        sections = {}
+        total_ms = sum(sum(values) for values in self.timings.values())
+        for name, values in self.timings.items():
+            if not values:
+                continue
+            sections[name] = {
+                'mean_ms': float(np.mean(values)),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'share': float(sum(values) / total_ms) if total_ms else 0.0
+            }
+        return {
+            'steps': len(self.step_times),
+            'samples_per_sec': (sum(self.step_samples) / sum(self.step_times)
+                                if self.step_times else 0.0),
+            'peak_memory_gb': self.peak_memory,
+            'sections': sections
+        }
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.stop()
+            self.trace = None
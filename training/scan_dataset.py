@@ -0,0 +1,32 @@
+import argparse
+import os
+
+from meld_dataset import scan_dataset, write_manifest, manifest_path_for
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, required=True)
+    parser.add_argument("--video-dir", type=str, required=True)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = args.output or manifest_path_for(args.csv)
+
+    print(f"Scanning {args.csv} with {args.workers} workers...")
+    manifest = scan_dataset(args.csv, args.video_dir, args.workers)
+    write_manifest(manifest, output)
+
+    print(f"Valid samples: {len(manifest['valid'])}/{manifest['total']}")
+    for filename, reason in manifest['invalid'].items():
+        print(f"{filename}: {reason}")
+    print(f"Manifest written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import torch
+from metrics import ConfusionMatrix
+
+
+def test_confusion_matrix():
+    matrix = ConfusionMatrix(3)
+    matrix.update(torch.tensor([0, 1, 1]), torch.tensor([0, 1, 2]))
+    matrix.update(torch.tensor([2, 0]), torch.tensor([2, 0]))
+
+    assert matrix.matrix.tolist() == [[2, 0, 0], [0, 1, 0], [0, 1, 1]]
+
+    stats = matrix.compute()
+    assert abs(stats['accuracy'] - 4 / 5) < 1e-9
+    # precision per class: 1, 1/2, 1 weighted by support 2, 1, 2
+    assert abs(stats['precision'] - (2 * 1 + 0.5 + 2 * 1) / 5) < 1e-9
+    # recall per class: 1, 1, 1/2
+    assert abs(stats['recall'] - (2 * 1 + 1 + 2 * 0.5) / 5) < 1e-9
+    assert stats['per_class']['support'] == [2, 1, 2]
+    assert abs(stats['per_class']['f1'][1] - 2 / 3) < 1e-9
+
+
+def test_unpredicted_class_scores_zero():
+    matrix = ConfusionMatrix(3)
+    matrix.update(torch.tensor([0, 0]), torch.tensor([0, 1]))
+
+    stats = matrix.compute()
+    assert stats['per_class']['precision'] == [0.5, 0.0, 0.0]
+    assert stats['per_class']['recall'] == [1.0, 0.0, 0.0]
+
+
+def test_merge():
+    first = ConfusionMatrix(2)
+    first.update(torch.tensor([0, 1]), torch.tensor([0, 0]))
+    second = ConfusionMatrix(2)
+    second.update(torch.tensor([1]), torch.tensor([1]))
+
+    assert first.merge(second).matrix.tolist() == [[1, 1], [0, 1]]
+
+
+if __name__ == '__main__':
+    test_confusion_matrix()
+    test_unpredicted_class_scores_zero()
+    test_merge()
@@ -0,0 +1,68 @@
+import math
+import torch
+from torch.utils.data import DataLoader
+
+from checkpointing import CheckpointManager
+from meld_dataset import ResumableSampler, collate_fn
+from models import build_model, MultimodalTrainer
+
+
+def make_loader():
+    samples = [{
+        'text_inputs': {'input_ids': torch.randint(0, 100, (8,)),
+                        'attention_mask': torch.ones(8, dtype=torch.long)},
+        'video_frames': torch.rand(3, 3, 32, 32),
+        'audio_features': torch.rand(1, 64, 20),
+        'emotion_label': torch.tensor(i % 7),
+        'sentiment_label': torch.tensor(i % 3)
+    } for i in range(8)]
+    return DataLoader(samples, batch_size=2, collate_fn=collate_fn, drop_last=True,
+                      sampler=ResumableSampler(samples, num_replicas=1, rank=0))
+
+
+def make_trainer(checkpoint_dir):
+    model = build_model({'architecture': 'student', 'frame_stride': 1},
+                        pretrained=False)
+    loader = make_loader()
+    # A checkpoint on every step, so the last one ends the epoch
+    return MultimodalTrainer(model, loader, loader,
+                             checkpoint_manager=CheckpointManager(checkpoint_dir),
+                             checkpoint_every=1)
+
+
+def test_resume_from_end_of_epoch_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    trainer = make_trainer(tmp_path / 'checkpoints')
+    trainer.train_epoch()
+    trainer.close()
+
+    resumed = make_trainer(tmp_path / 'checkpoints')
+    resumed.resume(resumed.checkpoint_manager.latest())
+    assert (resumed.epoch, resumed.batch_in_epoch) == (0, 4)
+
+    # Nothing is left of the interrupted epoch, the next one trains in full
+    losses = resumed.train_epoch()
+    assert all(math.isnan(value) for value in losses.values())
+    assert (resumed.epoch, resumed.batch_in_epoch) == (1, 0)
+
+    losses = resumed.train_epoch()
+    assert all(math.isfinite(value) for value in losses.values())
+    assert resumed.global_step == 8
+    resumed.close()
+
+
+def test_checkpoint_records_step_evaluation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    trainer = make_trainer(tmp_path / 'checkpoints')
+
+    # Stands in for the evaluation train.py runs on these steps
+    def on_step(step):
+        trainer.best_val_loss = float(step)
+
+    trainer.train_epoch(step_callback=on_step)
+    trainer.close()
+
+    resumed = make_trainer(tmp_path / 'checkpoints')
+    resumed.resume(resumed.checkpoint_manager.latest())
+    assert resumed.best_val_loss == resumed.global_step == 4
+    resumed.close()
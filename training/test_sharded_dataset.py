@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import tarfile
+import torch
+from torch.utils.data import DataLoader
+
+from meld_dataset import ShardedMELDDataset, collate_fn
+from pack_shards import add_member, shard_filename
+
+
+def write_shards(directory, sizes, broken=()):
+    # Decoded shards whose samples are numbered by their emotion label. The
+    # broken ones cannot be loaded
+    shards = []
+    label = 0
+    for shard_id, size in enumerate(sizes):
+        labels = list(range(label, label + size))
+        label += size
+        with tarfile.open(os.path.join(directory, shard_filename(shard_id)), 'w') as tar:
+            for i in labels:
+                sample = {
+                    'text_inputs': {'input_ids': torch.zeros(4, dtype=torch.long),
+                                    'attention_mask': torch.ones(4, dtype=torch.long)},
+                    'video_frames': torch.zeros(2, 3, 4, 4, dtype=torch.uint8),
+                    'audio_features': torch.zeros(1, 4, 4),
+                    'emotion_label': torch.tensor(i),
+                    'sentiment_label': torch.tensor(0)
+                }
+                buffer = io.BytesIO()
+                torch.save(sample, buffer)
+                add_member(tar, f"sample{i}.json", json.dumps({}).encode())
+                payload = b'broken' if i in broken else buffer.getvalue()
+                add_member(tar, f"sample{i}.pth", payload)
+        shards.append({'file': shard_filename(shard_id), 'size': size,
+                       'emotion_labels': labels, 'sentiment_labels': [0] * size})
+
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump({'version': 1, 'format': 'decoded', 'shards': shards}, f)
+
+
+def labels(dataset):
+    return [sample['emotion_label'].item() for sample in dataset]
+
+
+def test_evaluation_reads_every_sample_once(tmp_path):
+    write_shards(tmp_path, [3, 3, 2])
+
+    ranks = [ShardedMELDDataset(str(tmp_path), num_replicas=2, rank=rank)
+             for rank in range(2)]
+    seen = [labels(dataset) for dataset in ranks]
+
+    assert sorted(seen[0] + seen[1]) == list(range(8))
+    assert [len(dataset) for dataset in ranks] == [len(s) for s in seen]
+
+
+def test_training_ranks_get_equal_shuffled_shares(tmp_path):
+    write_shards(tmp_path, [3, 3, 2])
+
+    ranks = [ShardedMELDDataset(str(tmp_path), shuffle=True, shuffle_buffer_size=2,
+                                num_replicas=3, rank=rank)
+             for rank in range(3)]
+    assert [len(labels(dataset)) for dataset in ranks] == [2, 2, 2]
+
+    single = ShardedMELDDataset(str(tmp_path), shuffle=True, shuffle_buffer_size=4)
+    epochs = []
+    for epoch in range(2):
+        single.set_epoch(epoch)
+        epochs.append(labels(single))
+        assert sorted(epochs[-1]) == list(range(8))
+    assert epochs[0] != epochs[1]
+
+    # A resumed epoch continues where the interrupted one stopped
+    single.set_start_index(5)
+    assert labels(single) == epochs[1][5:]
+    assert len(single) == 3
+
+
+def test_workers_split_whole_batches(tmp_path):
+    # Three batches of 3 from 10 samples, two for one worker and one for
+    # the other, with nothing left over for drop_last to discard
+    write_shards(tmp_path, [4, 3, 3])
+    dataset = ShardedMELDDataset(str(tmp_path), shuffle=True, batch_size=3)
+
+    def batches():
+        loader = DataLoader(dataset, batch_size=3, num_workers=2, drop_last=True)
+        return len(loader), [batch['emotion_label'].tolist() for batch in loader]
+
+    length, epoch = batches()
+    assert length == len(epoch) == 3
+
+    # Each worker skips exactly the batches it handed out before
+    dataset.set_start_index(3)
+    length, resumed = batches()
+    assert length == len(resumed) == 2
+    assert sorted(resumed) == sorted(epoch[1:])
+
+
+def test_undecodable_samples_keep_batches_whole(tmp_path):
+    write_shards(tmp_path, [4, 3, 3], broken={1, 6})
+    dataset = ShardedMELDDataset(str(tmp_path), shuffle=True, batch_size=3)
+    loader = DataLoader(dataset, batch_size=3, num_workers=2, drop_last=True,
+                        collate_fn=collate_fn)
+
+    epoch = [batch['emotion_label'].tolist() for batch in loader]
+    assert len(epoch) == len(loader) == 3
+    assert all(len(batch) == 3 for batch in epoch)
+    assert not {1, 6} & {label for batch in epoch for label in batch}
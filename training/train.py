@@ -6,9 +6,20 @@ from tqdm import tqdm
 import json
 import sys
 
-from meld_dataset import prepare_dataloaders
-from models import MultimodalSentimentModel, MultimodalTrainer
+from meld_dataset import prepare_dataloaders, subsample_loader
+import bootstrap  # noqa: F401
+from preprocessing import thread_budget, apply_thread_budget
+from modeling import (MultimodalSentimentModel, build_model, MODEL_CONFIG_NAME,
+                      save_model_weights, load_model_weights, MODEL_WEIGHTS_NAME)
+from models import MultimodalTrainer, EVALUATION_METRICS
 from install_ffmpeg import install_ffmpeg
+from checkpointing import CheckpointManager
+from early_stopping import EarlyStopping
+from profiling import StepProfiler
+from distributed import (setup_distributed, cleanup_distributed, barrier,
+                         is_distributed, is_main_process, get_local_rank,
+                         get_local_world_size,
+                         get_world_size, wrap_model, unwrap_model)
 
 # AWS SageMaker
 SM_MODEL_DIR = os.environ.get('SM_MODEL_DIR', ".")
@@ -27,32 +38,110 @@ def parse_args():
     parser.add_argument("--epochs", type=int, default=20)
     parser.add_argument("--batch-size", type=int, default=16)
     parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--gradient-accumulation-steps", type=int, default=1)
+    parser.add_argument("--log-interval", type=int, default=50)
+
+    # Full-state checkpoints for resuming interrupted jobs. Defaults to
+    # <model-dir>/checkpoints
+    parser.add_argument("--checkpoint-dir", type=str, default=None)
+    parser.add_argument("--checkpoint-every-steps", type=int, default=500)
+    parser.add_argument("--keep-checkpoints", type=int, default=3)
+
+    # Evaluation cadence. Intermediate evaluations can use a fixed subsample
+    # of the validation set; the full set is always evaluated at the end
+    parser.add_argument("--eval-every-epochs", type=int, default=1)
+    parser.add_argument("--eval-every-steps", type=int, default=0)
+    parser.add_argument("--eval-subsample", type=int, default=0)
+
+    # Early stopping is off while patience is 0. The metric is "loss" or a
+    # validation metric such as "emotion_f1"
+    parser.add_argument("--early-stopping-patience", type=int, default=0)
+    # Checked here, not hours later at the first evaluation
+    parser.add_argument("--early-stopping-metric", type=str, default="loss",
+                        choices=["loss"] + [f"{name}_{key}"
+                                            for name, key in EVALUATION_METRICS])
+    parser.add_argument("--early-stopping-min-delta", type=float, default=0.0)
+
+    # Fine-tune the last N r3d_18 residual stages (0-4), optionally trading
+    # recompute for activation memory
+    parser.add_argument("--video-finetune-stages", type=int, default=0)
+    parser.add_argument("--gradient-checkpointing", action="store_true")
+
+    # Model architecture. A student is distilled from --teacher-model (the
+    # model.safetensors or model.pth of a trained multimodal model) when one
+    # is given
+    parser.add_argument("--architecture", type=str, default="multimodal",
+                        choices=["multimodal", "student"])
+    parser.add_argument("--student-frame-stride", type=int, default=3)
+    parser.add_argument("--teacher-model", type=str, default=None)
+    parser.add_argument("--distill-alpha", type=float, default=0.5)
+    parser.add_argument("--distill-temperature", type=float, default=2.0)
+
+    # safetensors stores the trained weights only and loads memory-mapped,
+    # pth is the full state dict
+    parser.add_argument("--model-format", type=str, default="safetensors",
+                        choices=["safetensors", "pth"])
+    # Leave the frozen BERT and r3d_18 weights out of model.safetensors. The
+    # file is far smaller, but loading downloads them again and cannot share
+    # them between processes
+    parser.add_argument("--omit-base-weights", action="store_true")
+
+    # Per-step timing breakdown (TensorBoard + profile_summary.json), and an
+    # optional torch.profiler trace of --profile-trace-steps steps
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-trace-start", type=int, default=10)
+    parser.add_argument("--profile-trace-steps", type=int, default=0)
+    parser.add_argument("--profile-trace-dir", type=str, default=None)
+
+    # Distributed training, set up by torchrun. --batch-size is per process
+    parser.add_argument("--dist-backend", type=str, default=None,
+                        choices=["nccl", "gloo"])
 
     # Data directories
     parser.add_argument("--train-dir", type=str, default=SM_CHANNEL_TRAINING)
     parser.add_argument("--val-dir", type=str, default=SM_CHANNEL_VALIDATION)
     parser.add_argument("--test-dir", type=str, default=SM_CHANNEL_TEST)
     parser.add_argument("--model-dir", type=str, default=SM_MODEL_DIR)
+    # Shards written by pack_shards.py, streamed instead of the clips. A
+    # directory, or "pipe:" and a command printing the file named by {},
+    # e.g. "pipe:aws s3 cp s3://bucket/dataset/train/train_splits_shards/{} -".
+    # Shards packed next to a split's clips are picked up without these
+    parser.add_argument("--train-shards", type=str, default=None)
+    parser.add_argument("--val-shards", type=str, default=None)
+    parser.add_argument("--test-shards", type=str, default=None)
+    parser.add_argument("--shuffle-buffer", type=int, default=256,
+                        help="Samples held per loader to shuffle streamed shards")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.keep_checkpoints < 1:
+        parser.error("--keep-checkpoints must be at least 1")
+    return args
 
 
 def main():
-    if not install_ffmpeg():
+    args = parse_args()
+    device = setup_distributed(args.dist_backend)
+    # Ranks on a node decode their batches in-process and share its cores
+    budget = apply_thread_budget(thread_budget(workers=get_local_world_size()))
+
+    # One installer per node, the other local ranks wait for it
+    if get_local_rank() == 0 and not install_ffmpeg():
         print("Error: FFmpeg installation failed. Cannot continue training.")
         sys.exit(1)
+    barrier()
 
-    print("Available audio backends:")
-    print(str(torchaudio.list_audio_backends()))
-
-    args = parse_args()
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if is_main_process():
+        print("Available audio backends:")
+        print(str(torchaudio.list_audio_backends()))
+        print(f"World size: {get_world_size()}, device: {device}")
+        print(f"Thread budget per rank: {budget}")
 
     # Track initial GPU memory if available
     if torch.cuda.is_available():
         torch.cuda.reset_peak_memory_stats()
         memory_used = torch.cuda.max_memory_allocated() / 1024**3
-        print(f"Initial GPU memory used: {memory_used:.2f} GB")
+        if is_main_process():
+            print(f"Initial GPU memory used: {memory_used:.2f} GB")
 
     train_loader, val_loader, test_loader = prepare_dataloaders(
         train_csv=os.path.join(args.train_dir, 'train_sent_emo.csv'),
@@ -62,17 +151,85 @@ def main():
         test_csv=os.path.join(args.test_dir, 'test_sent_emo.csv'),
         test_video_dir=os.path.join(
             args.test_dir, 'output_repeated_splits_test'),
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        distributed=is_distributed(),
+        shards={'train': args.train_shards, 'dev': args.val_shards,
+                'test': args.test_shards},
+        shuffle_buffer_size=args.shuffle_buffer
     )
 
-    print(f"""Training DSV path: {os.path.join(
-        args.train_dir, 'train_sent_emo.csv')}""")
-    print(f"""Training video directory: {
-          os.path.join(args.train_dir, 'train_splits')}""")
+    if is_main_process():
+        print(f"""Training DSV path: {os.path.join(
+            args.train_dir, 'train_sent_emo.csv')}""")
+        print(f"""Training video directory: {
+              os.path.join(args.train_dir, 'train_splits')}""")
+
+    if args.architecture == "student":
+        model_config = {"architecture": "student",
+                        "frame_stride": args.student_frame_stride}
+        model = build_model(model_config).to(device)
+    else:
+        model_config = {"architecture": "multimodal"}
+        model = MultimodalSentimentModel(
+            video_finetune_stages=args.video_finetune_stages,
+            gradient_checkpointing=args.gradient_checkpointing).to(device)
+    model = wrap_model(model, device)
+
+    # Deployment rebuilds the architecture from this file
+    if is_main_process():
+        os.makedirs(args.model_dir, exist_ok=True)
+        with open(os.path.join(args.model_dir, MODEL_CONFIG_NAME), "w") as f:
+            json.dump(model_config, f)
+
+    teacher = None
+    if args.teacher_model:
+        if args.teacher_model.endswith(".safetensors"):
+            teacher, _ = load_model_weights(args.teacher_model, device)
+        else:
+            teacher = MultimodalSentimentModel().to(device)
+            teacher.load_state_dict(torch.load(
+                args.teacher_model, map_location=device, weights_only=True))
+        if is_main_process():
+            print(f"Distilling from teacher {args.teacher_model} "
+                  f"(alpha {args.distill_alpha}, T {args.distill_temperature})")
+
+    profiler = None
+    if args.profile:
+        trace_dir = args.profile_trace_dir or (
+            '/opt/ml/output/tensorboard/profiler' if 'SM_MODEL_DIR' in os.environ
+            else 'runs/profiler')
+        profiler = StepProfiler(
+            device, trace_dir=trace_dir,
+            trace_start=args.profile_trace_start,
+            trace_steps=args.profile_trace_steps)
 
-    model = MultimodalSentimentModel().to(device)
-    trainer = MultimodalTrainer(model, train_loader, val_loader)
-    best_val_loss = float('inf')
+    trainer = MultimodalTrainer(
+        model, train_loader, val_loader,
+        accumulation_steps=args.gradient_accumulation_steps,
+        log_interval=args.log_interval,
+        checkpoint_manager=CheckpointManager(
+            args.checkpoint_dir or os.path.join(args.model_dir, 'checkpoints'),
+            keep_last=args.keep_checkpoints),
+        checkpoint_every=args.checkpoint_every_steps,
+        early_stopping=EarlyStopping(
+            metric=args.early_stopping_metric,
+            patience=args.early_stopping_patience,
+            min_delta=args.early_stopping_min_delta)
+        if args.early_stopping_patience > 0 else None,
+        profiler=profiler,
+        teacher=teacher,
+        distill_alpha=args.distill_alpha,
+        distill_temperature=args.distill_temperature)
+
+    # Pick up where an interrupted run left off
+    latest_checkpoint = trainer.checkpoint_manager.latest()
+    if latest_checkpoint is not None:
+        trainer.resume(latest_checkpoint)
+
+    if is_main_process():
+        effective_batch_size = (args.batch_size * args.gradient_accumulation_steps
+                                * get_world_size())
+        print(f"Effective batch size: {effective_batch_size}")
 
     metrics_data = {
         "train_losses": [],
@@ -80,59 +237,144 @@ def main():
         "epochs": []
     }
 
-    for epoch in tqdm(range(args.epochs), desc="Epochs"):
-        train_loss = trainer.train_epoch()
-        val_loss, val_metrics = trainer.evaluate(val_loader)
+    eval_loader = val_loader
+    if args.eval_subsample > 0:
+        eval_loader = subsample_loader(val_loader, args.eval_subsample)
+    last_full_eval_step = None
+
+    def validate(train_loss=None):
+        nonlocal last_full_eval_step
+        val_loss, val_metrics = trainer.evaluate(eval_loader)
+        if eval_loader is val_loader:
+            last_full_eval_step = trainer.global_step
+
+        # Save best model, before the checkpoint that records it as best
+        if val_loss["total"] < trainer.best_val_loss:
+            trainer.best_val_loss = val_loss["total"]
+            if is_main_process() and args.model_format == "safetensors":
+                save_model_weights(unwrap_model(model), os.path.join(
+                    args.model_dir, MODEL_WEIGHTS_NAME), model_config,
+                    train_loader.dataset.preprocessing,
+                    include_base_weights=not args.omit_base_weights)
+            elif is_main_process():
+                torch.save(unwrap_model(model).state_dict(), os.path.join(
+                    args.model_dir, "model.pth"))
+
+        if trainer.early_stopping is not None:
+            trainer.early_stopping.step(
+                trainer.early_stopping.get_value(val_loss, val_metrics))
+            if trainer.should_stop and is_main_process():
+                print(f"Early stopping at step {trainer.global_step}: no "
+                      f"{args.early_stopping_metric} improvement in "
+                      f"{args.early_stopping_patience} evaluations")
+
+        if not is_main_process():
+            return val_loss
+
+        # Log metrics in SageMaker format
+        metrics = [
+            {"Name": "validation:loss", "Value": val_loss["total"]},
+            {"Name": "validation:emotion_precision",
+                "Value": val_metrics["emotion_precision"]},
+            {"Name": "validation:emotion_accuracy",
+                "Value": val_metrics["emotion_accuracy"]},
+            {"Name": "validation:sentiment_precision",
+                "Value": val_metrics["sentiment_precision"]},
+            {"Name": "validation:sentiment_accuracy",
+                "Value": val_metrics["sentiment_accuracy"]},
+            {"Name": "validation:emotion_f1",
+                "Value": val_metrics["emotion_f1"]},
+            {"Name": "validation:sentiment_f1",
+                "Value": val_metrics["sentiment_f1"]},
+        ]
+        if train_loss is not None:
+            metrics.insert(0, {"Name": "train:loss", "Value": train_loss["total"]})
+        print(json.dumps({"metrics": metrics}))
+
+        return val_loss
+
+    def on_step(step):
+        if args.eval_every_steps and step % args.eval_every_steps == 0:
+            validate()
+
+    for epoch in tqdm(range(trainer.epoch, args.epochs), desc="Epochs",
+                      disable=not is_main_process()):
+        train_loss = trainer.train_epoch(step_callback=on_step)
 
         # Track metrics
         metrics_data["train_losses"].append(train_loss["total"])
-        metrics_data["val_losses"].append(val_loss["total"])
         metrics_data["epochs"].append(epoch)
 
-        # Log metrics in SageMaker format
-        print(json.dumps({
-            "metrics": [
-                {"Name": "train:loss", "Value": train_loss["total"]},
-                {"Name": "validation:loss", "Value": val_loss["total"]},
-                {"Name": "validation:emotion_precision",
-                    "Value": val_metrics["emotion_precision"]},
-                {"Name": "validation:emotion_accuracy",
-                    "Value": val_metrics["emotion_accuracy"]},
-                {"Name": "validation:sentiment_precision",
-                    "Value": val_metrics["sentiment_precision"]},
-                {"Name": "validation:sentiment_accuracy",
-                    "Value": val_metrics["sentiment_accuracy"]},
-            ]
-        }))
+        if not trainer.should_stop and (epoch + 1) % args.eval_every_epochs == 0:
+            val_loss = validate(train_loss)
+            metrics_data["val_losses"].append(val_loss["total"])
+
+        trainer.save_checkpoint()
+
+        if is_main_process() and torch.cuda.is_available():
+            print(f"Peak GPU memory per training step: {trainer.epoch_peak_memory:.2f} GB")
 
-        if torch.cuda.is_available():
-            memory_used = torch.cuda.max_memory_allocated() / 1024**3
-            print(f"Peak GPU memory used: {memory_used:.2f} GB")
+        if trainer.should_stop:
+            break
 
-        # Save best model
-        if val_loss["total"] < best_val_loss:
-            best_val_loss = val_loss["total"]
-            torch.save(model.state_dict(), os.path.join(
-                args.model_dir, "model.pth"))
+    if profiler is not None:
+        profiler.close()
+        summary = profiler.summary()
+        if is_main_process():
+            with open(os.path.join(args.model_dir, "profile_summary.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+            print(f"Throughput: {summary['samples_per_sec']:.1f} samples/sec per process")
+            for name, section in summary['sections'].items():
+                print(f"  {name}: {section['mean_ms']:.1f} ms "
+                      f"(p95 {section['p95_ms']:.1f} ms, {section['share']:.0%})")
+
+    # Unless the final weights were already scored on the full validation set
+    if last_full_eval_step != trainer.global_step:
+        if is_main_process():
+            print("Evaluating on full validation set...")
+        val_loss, val_metrics = trainer.evaluate(val_loader, phase="val_final")
+        if is_main_process():
+            print(json.dumps({
+                "metrics": [
+                    {"Name": "validation_final:loss", "Value": val_loss["total"]},
+                    {"Name": "validation_final:emotion_accuracy",
+                        "Value": val_metrics["emotion_accuracy"]},
+                    {"Name": "validation_final:sentiment_accuracy",
+                        "Value": val_metrics["sentiment_accuracy"]},
+                    {"Name": "validation_final:emotion_f1",
+                        "Value": val_metrics["emotion_f1"]},
+                    {"Name": "validation_final:sentiment_f1",
+                        "Value": val_metrics["sentiment_f1"]},
+                ]
+            }))
 
     # After training is complete, evaluate on test set
-    print("Evaluating on test set...")
+    if is_main_process():
+        print("Evaluating on test set...")
     test_loss, test_metrics = trainer.evaluate(test_loader, phase="test")
     metrics_data["test_loss"] = test_loss["total"]
 
-    print(json.dumps({
-        "metrics": [
-            {"Name": "test:loss", "Value": test_loss["total"]},
-            {"Name": "test:emotion_accuracy",
-                "Value": test_metrics["emotion_accuracy"]},
-            {"Name": "test:sentiment_accuracy",
-                "Value": test_metrics["sentiment_accuracy"]},
-            {"Name": "test:emotion_precision",
-                "Value": test_metrics["emotion_precision"]},
-            {"Name": "test:sentiment_precision",
-                "Value": test_metrics["sentiment_precision"]},
-        ]
-    }))
+    if is_main_process():
+        print(json.dumps({
+            "metrics": [
+                {"Name": "test:loss", "Value": test_loss["total"]},
+                {"Name": "test:emotion_accuracy",
+                    "Value": test_metrics["emotion_accuracy"]},
+                {"Name": "test:sentiment_accuracy",
+                    "Value": test_metrics["sentiment_accuracy"]},
+                {"Name": "test:emotion_precision",
+                    "Value": test_metrics["emotion_precision"]},
+                {"Name": "test:sentiment_precision",
+                    "Value": test_metrics["sentiment_precision"]},
+                {"Name": "test:emotion_f1",
+                    "Value": test_metrics["emotion_f1"]},
+                {"Name": "test:sentiment_f1",
+                    "Value": test_metrics["sentiment_f1"]},
+            ]
+        }))
+
+    trainer.close()
+    cleanup_distributed()
 
 
 if __name__ == "__main__":